@@ -2,18 +2,28 @@ from dash import dcc, html, dash_table, Dash
 import dash_bootstrap_components as dbc
 import dash_cytoscape as cyto
 from dash.dependencies import Input, Output, State
+from dash import ctx
+from dash.exceptions import PreventUpdate
+from flask import abort, make_response, request
 import dash_auth
 import plotly.express as px
 
 import pandas as pd
-import json
-import igraph as ig
+import math
+from datetime import datetime, timezone
+
+from communities import community_membership, quotient_graph
+from elements import ELEMENT_BUDGETS, lod_elements, quotient_elements, set_positions
+from graph_store import get_graph, store
+from layouts import SERVER_LAYOUTS
+from metrics import instrument, instrument_route, register_metrics, stage
+from networks import INTERACTION_TYPES
 
 
 cyto.load_extra_layouts()
 
 app = Dash(__name__, external_stylesheets=[
-           dbc.themes.BOOTSTRAP])
+           dbc.themes.BOOTSTRAP], compress=True)
 
 VALID_USERNAME_PASSWORD_PAIRS = {
     'hello': 'world'
@@ -27,7 +37,15 @@ auth = dash_auth.BasicAuth(
 # Create server variable with Flask server object for use with gunicorn
 server = app.server
 
-main_attr = "worldcup"
+# /metrics in Prometheus format when SNA_METRICS=1, see metrics.py
+register_metrics(server, auth=auth)
+
+CENTRALITY_LABELS = {
+    'pagerank': 'PageRank',
+    'strength': 'Weighted Degree',
+    'coreness': 'K-Core',
+    'betweenness': 'Betweenness',
+}
 
 def dash_tbl(df):
     tbl = dash_table.DataTable(
@@ -53,28 +71,86 @@ def cyto_interaction(elements):
 
 
 
+cyto_stylesheet = [
+    {
+        'selector': '.community',
+        'style': {
+            'label': 'data(label)',
+            'background-color': '#999999',
+            'width': 'mapData(size, 1, 1000, 20, 80)',
+            'height': 'mapData(size, 1, 1000, 20, 80)',
+        }
+    },
+    {
+        'selector': '.aggregated',
+        'style': {
+            'width': 'mapData(weight, 1, 100, 1, 8)',
+        }
+    },
+]
+
+
 def list_to_df(lst):
     cent_df = pd.DataFrame(lst, columns=["Name", "Centrality"])
     dff = cent_df.to_dict('records')
     return dff
 
 
-with open(f"export/{main_attr}/lda_topics.json", "r") as f:
-    lda_topics = json.load(f)
-topics_txt = [lda_topics[str(i)] for i in range(len(lda_topics))]
-topics_txt = [[j.split("*")[1].replace('"', "")
-               for j in i] for i in topics_txt]
-topics_txt = ["; ".join(i) for i in topics_txt]
+def get_entry(dataset, value):
+    """GraphEntry of the selected network, no update while the selection is not (yet) valid."""
+    if not dataset or not value or not store.has(dataset, value):
+        raise PreventUpdate
+    return get_graph(dataset, value)
+
+
+def degree_page(dataset, value, mode, page_current, page_size, sort_by):
+    """One page of a degree table, computed on the server.
+
+    Parameters:
+    dataset (str): export subfolder
+    value (str): interaction type
+    mode (str): 'in', 'out' or a centrality measure
+    page_current (int): page shown by the DataTable
+    page_size (int): rows per page
+    sort_by (list): DataTable sort_by, defaults to degree descending
+
+    Returns:
+    data (list): table records of the page
+    page_count (int): number of pages
+    """
+    with stage('load'):
+        entry = get_entry(dataset, value)
+    page_count = max(1, math.ceil(len(entry.labels) / page_size))
+    page_current = min(page_current or 0, page_count - 1)
+    by_label, ascending = False, False
+    if sort_by:
+        by_label = sort_by[0]['column_id'] == 'Name'
+        ascending = sort_by[0]['direction'] == 'asc'
+    with stage('rank'):
+        rows = entry.page(mode, page_current, page_size, by_label, ascending)
+    return list_to_df(rows), page_count
+
 
 col_swatch = px.colors.qualitative.Dark24
 
-topics_html = list()
-for topic_html in [
-    html.Span([str(i) + ": " + topics_txt[i]], style={"color": col_swatch[i]})
-    for i in range(len(topics_txt))
-]:
-    topics_html.append(topic_html)
-    topics_html.append(html.Br())
+
+def topic_stylesheet(topics_txt):
+    # colour users by their main topic when the export carries topics
+    return [
+        {'selector': f'[topic = {i}]', 'style': {'background-color': col_swatch[i % len(col_swatch)]}}
+        for i in range(len(topics_txt))
+    ] + cyto_stylesheet
+
+
+def topics_legend(topics_txt):
+    topics_html = list()
+    for topic_html in [
+        html.Span([str(i) + ": " + topics_txt[i]], style={"color": col_swatch[i % len(col_swatch)]})
+        for i in range(len(topics_txt))
+    ]:
+        topics_html.append(topic_html)
+        topics_html.append(html.Br())
+    return topics_html
 
 
 navbar = dbc.NavbarSimple(
@@ -108,12 +184,7 @@ body_layout = dbc.Container(
                 dcc.Dropdown(
                     id='dropdown-update-interaction',
                     clearable=False,
-                    options=[
-                        {'label': 'Mention', 'value': 'mention'},
-                        {'label': 'Retweet', 'value': 'retweet'},
-                        {'label': 'Reply', 'value': 'reply'},
-                        {'label': 'Quote', 'value': 'quote'},
-                    ],
+                    options=[],
                     value='mention'
                 ),
                 # html.Div(id='output-container-1'),
@@ -132,7 +203,13 @@ body_layout = dbc.Container(
                         dbc.Label('In-Degree Measures'),
                         dash_table.DataTable(
                             id='tblin',
+                            columns=[{"name": i, "id": i} for i in ["Name", "Centrality"]],
+                            page_current=0,
                             page_size=20,  # we have less data in this example, so setting to 20
+                            page_action='custom',
+                            sort_action='custom',
+                            sort_mode='single',
+                            sort_by=[],
                             style_table={
                                 'height': '200px',
                                 'overflowY': 'auto',
@@ -148,7 +225,13 @@ body_layout = dbc.Container(
                         dbc.Label('Out-Degree Measures'),
                         dash_table.DataTable(
                             id='tblout',
+                            columns=[{"name": i, "id": i} for i in ["Name", "Centrality"]],
+                            page_current=0,
                             page_size=20,  # we have less data in this example, so setting to 20
+                            page_action='custom',
+                            sort_action='custom',
+                            sort_mode='single',
+                            sort_by=[],
                             style_table={
                                 'height': '200px',
                                 'overflowY': 'auto',
@@ -158,6 +241,42 @@ body_layout = dbc.Container(
                         dbc.Alert(id='tbl_out'),
                     ])
                 ),
+                dcc.Markdown(
+                    f"""
+                    PageRank and betweenness measure how central a user is in the whole network,
+                    weighted degree counts all their interactions and the k-core is the most
+                    connected group of users they belong to.
+                    """
+                ),
+                dbc.Col(
+                    dbc.Container([
+                        dbc.Label('Select Centrality Measure'),
+                        dcc.Dropdown(
+                            id='dropdown-update-centrality',
+                            clearable=False,
+                            options=[
+                                {'label': label, 'value': name}
+                                for name, label in CENTRALITY_LABELS.items()
+                            ],
+                            value='pagerank'
+                        ),
+                        dash_table.DataTable(
+                            id='tblcentrality',
+                            columns=[{"name": i, "id": i} for i in ["Name", "Centrality"]],
+                            page_current=0,
+                            page_size=20,
+                            page_action='custom',
+                            sort_action='custom',
+                            sort_mode='single',
+                            sort_by=[],
+                            style_table={
+                                'height': '200px',
+                                'overflowY': 'auto',
+                                'textAlign': 'left'
+                            },
+                            style_cell={'textAlign': 'left'}),
+                    ])
+                ),
 
             ]
         ),
@@ -178,6 +297,9 @@ body_layout = dbc.Container(
                                     options=[
                                         {'label': name.capitalize(), 'value': name}
                                         for name in ['cose', 'grid', 'random', 'circle', 'cola', 'concentric']
+                                    ] + [
+                                        {'label': f'{label} (precomputed)', 'value': f'server-{name}'}
+                                        for name, label in [('drl', 'DrL'), ('fr', 'Fruchterman-Reingold')]
                                     ]
                                 ),
                             ],
@@ -185,15 +307,65 @@ body_layout = dbc.Container(
                             md=5,
 
                         ),
+                        dbc.Col(
+                            [
+                                dbc.Label(
+                                    "Maximum number of nodes and links",
+                                    className="mr-1",
+                                ),
+                                dcc.Dropdown(
+                                    id='dropdown-update-budget',
+                                    value=2000,
+                                    clearable=False,
+                                    options=[
+                                        {'label': str(n), 'value': n}
+                                        for n in [500, 1000, 2000, 5000]
+                                    ] + [{'label': 'All', 'value': 0},
+                                         {'label': 'Communities only', 'value': -1}]
+                                ),
+                            ],
+                            sm=12,
+                            md=4,
+                        ),
+                        dbc.Col(
+                            [
+                                dbc.Button(
+                                    "Show whole network",
+                                    id='button-reset-focus',
+                                    color="secondary",
+                                    className="mt-4",
+                                ),
+                            ],
+                            sm=12,
+                            md=3,
+                        ),
 
                     ]
                 ),
+                dcc.Markdown(
+                    """
+                    Large networks show their most connected users; everybody else is grouped
+                    into grey community nodes. Click a community node to show its members.
+                    """
+                ),
+                dbc.Label('Time window (UTC)'),
+                dcc.RangeSlider(
+                    id='slider-time',
+                    min=0,
+                    max=1,
+                    value=None,
+                    allowCross=False,
+                    updatemode='mouseup',
+                ),
+                html.Div(id='time-window-info', style={"fontSize": 13, "color": "gray"}),
+                dcc.Store(id='lod-focus'),
                 dbc.Row(
                     [
                         cyto.Cytoscape(
                             id="core_19_cytoscape",
                             layout={"name": "cola"},
                             style={"width": "100%", "height": "700px"},
+                            stylesheet=cyto_stylesheet,
                         )
                     ]
                 )
@@ -218,7 +390,7 @@ body_layout = dbc.Container(
 
                 ]),
                 html.Div(
-                    topics_html,
+                    id='topics-legend',
                     style={
                         "fontSize": 15,
                         "height": "300px",
@@ -245,12 +417,61 @@ body_layout = dbc.Container(
     style={"marginTop": 20},
 )
 
-app.layout = html.Div([navbar, body_layout])
+
+
+def dataset_selector():
+    datasets = store.datasets()
+    return dbc.Container(
+        [
+            dbc.Label('Select Dataset'),
+            dcc.Dropdown(
+                id='dropdown-update-dataset',
+                clearable=False,
+                options=[{'label': name, 'value': name} for name in datasets],
+                value=datasets[0] if datasets else None
+            ),
+        ],
+        style={"marginTop": 20},
+    )
+
+
+def serve_layout():
+    # datasets are listed on every page load, new exports show up without a restart
+    return html.Div([navbar, dataset_selector(), body_layout])
+
+
+app.layout = serve_layout
+
+
+@app.callback(
+    Output('dropdown-update-interaction', 'options'),
+    Output('dropdown-update-interaction', 'value'),
+    Input('dropdown-update-dataset', 'value'),
+    State('dropdown-update-interaction', 'value'))
+def update_interaction_types(dataset, value):
+    available = store.interaction_types(dataset) if store.is_dataset(dataset) else set()
+    types = [t for t in INTERACTION_TYPES if t in available]
+    options = [{'label': t.capitalize(), 'value': t} for t in types]
+    return options, value if value in types else (types[0] if types else None)
+
+
+@app.callback(
+    Output('core_19_cytoscape', 'stylesheet'),
+    Output('topics-legend', 'children'),
+    Input('dropdown-update-dataset', 'value'))
+def update_topics(dataset):
+    if not store.is_dataset(dataset):
+        raise PreventUpdate
+    topics_txt = store.topics(dataset)
+    return topic_stylesheet(topics_txt), topics_legend(topics_txt)
 
 
 @app.callback(Output('core_19_cytoscape', 'layout'),
               Input('dropdown-update-layout', 'value'))
 def update_layout(layout):
+    # server layouts come with the node positions, see update_net_graph
+    if layout.startswith('server-'):
+        return {'name': 'preset'}
     return {
         'name': layout,
         'animate': True
@@ -279,71 +500,191 @@ def update_testing(value):
 
 
 @app.callback(
-    Output('core_19_cytoscape', 'elements'),
+    Output('lod-focus', 'data'),
+    Input('core_19_cytoscape', 'tapNodeData'),
+    Input('button-reset-focus', 'n_clicks'),
+    Input('dropdown-update-dataset', 'value'),
     Input('dropdown-update-interaction', 'value'))
-def update_net_graph(value):
-    url = f'export/{main_attr}/{value}.gml'
-    data = ig.Graph.Read_GML(url)
-    labels = list(data.vs['screenname'])
-    id = list(data.vs['id'])
+def update_focus(node, n_clicks, dataset, value):
+    if ctx.triggered_id == 'core_19_cytoscape' and node and 'community' in node:
+        return {'dataset': dataset, 'interaction': value, 'community': node['community']}
+    return None
 
-    id = [int(x) for x in id]
-    id = [str(x) for x in id]
 
-    nodes_name = zip(id, labels)
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%d %b %H:%M')
 
-    E = [e.tuple for e in data.es]
-    E = [tuple(map(str, tup)) for tup in E]
 
-    nodes = [
-        {
-            'data': {'id': short, 'label': label}
-        }
-        for short, label in nodes_name
-    ]
+@app.callback(
+    Output('slider-time', 'min'),
+    Output('slider-time', 'max'),
+    Output('slider-time', 'step'),
+    Output('slider-time', 'marks'),
+    Output('slider-time', 'value'),
+    Output('slider-time', 'disabled'),
+    Input('dropdown-update-dataset', 'value'),
+    Input('dropdown-update-interaction', 'value'))
+@instrument
+def update_time_slider(dataset, value):
+    index = get_entry(dataset, value).temporal()
+    bins = index.bins()
+    # at most ~12 labelled marks, one per bin on short collections
+    every = max(1, math.ceil(len(bins) / 12))
+    marks = {int(start): format_time(start) for start in bins['start'][::every]}
+    end = int(bins['end'].iloc[-1])
+    # collapsed exports without interaction timestamps only know when an edge started
+    return int(bins['start'].iloc[0]), end, index.bin_width, marks, [int(bins['start'].iloc[0]), end], not index.exact
 
-    edges = [
-        {'data': {'source': source, 'target': target}}
-        for source, target in E
-    ]
 
-    elements = nodes + edges
-    return elements
+@app.callback(
+    Output('time-window-info', 'children'),
+    Input('dropdown-update-dataset', 'value'),
+    Input('dropdown-update-interaction', 'value'),
+    Input('slider-time', 'value'))
+def update_time_info(dataset, value, window):
+    if not window:
+        return ''
+    index = get_entry(dataset, value).temporal()
+    if not index.exact:
+        return 'No interaction timestamps saved with this collapsed network, the time window is disabled'
+    bins = index.bins()
+    inside = bins[(bins['start'] >= window[0]) & (bins['end'] <= window[1])]
+    return (f"{format_time(window[0])} to {format_time(window[1] + 1)}: "
+            f"{inside['interactions'].sum()} interactions, "
+            f"up to {inside['users'].max() if len(inside) else 0} active users per hour")
+
+
+@server.route('/elements/<dataset>/<interaction_type>')
+@instrument_route
+def serve_elements(dataset, interaction_type):
+    """Elements of a whole network as JSON, built once and revalidated by ETag.
+
+    Query parameters are the budget and the server layout. Responses are
+    gzip-compressed like every other Dash response (compress=True).
+    """
+    # checked here too, dash-auth 1.x only protects the Dash routes
+    if not auth.is_authorized():
+        return auth.login_request()
+    budget = request.args.get('budget', 2000, type=int)
+    layout = request.args.get('layout')
+    if (interaction_type not in INTERACTION_TYPES or not store.has(dataset, interaction_type)
+            or budget not in ELEMENT_BUDGETS + (0,)
+            or (layout is not None and layout not in SERVER_LAYOUTS)):
+        abort(404)
+    with stage('load'):
+        entry = get_graph(dataset, interaction_type)
+    with stage('elements'):
+        body, etag = entry.elements_json(budget, layout)
+    response = make_response(body)
+    response.mimetype = 'application/json'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 
 @app.callback(
-    Output('tblin', 'data'),
-    Input('dropdown-update-interaction', 'value'))
-def update_tblin(value):
-    url = f'export/{main_attr}/{value}.gml'
-    data = ig.Graph.Read_GML(url)
-    labels = list(data.vs['screenname'])
-    _inlist = data.indegree()
-
-    inlist = list(zip(labels, _inlist))
-    inlist.sort(key=lambda i: i[1], reverse=True)
+    Output('core_19_cytoscape', 'elements'),
+    Input('dropdown-update-dataset', 'value'),
+    Input('dropdown-update-interaction', 'value'),
+    Input('dropdown-update-budget', 'value'),
+    Input('lod-focus', 'data'),
+    Input('dropdown-update-layout', 'value'),
+    Input('slider-time', 'value'))
+@instrument
+def update_net_graph(dataset, value, budget, focus, layout, window):
+    with stage('load'):
+        entry = get_entry(dataset, value)
+        membership = entry.membership()
+        index = entry.temporal()
+    data = entry.graph
+    labels = entry.labels
+    degree = entry.degree
+    topics = entry.topics
+    ids = None
+
+    # restrict to the interactions inside the time window
+    if window and index.exact and (window[0] > index.start or window[1] < index.end):
+        data, ids = index.subgraph(data, window[0], window[1])
+        labels = [labels[i] for i in ids]
+        degree = index.degrees(window[0], window[1], mode='all')[ids]
+        membership = membership[ids]
+        if topics is not None:
+            topics = topics[ids]
+
+    # drill into one community: draw its members only
+    focused = focus and focus.get('dataset') == dataset and focus['interaction'] == value
+    if focused:
+        members = (membership == focus['community']).nonzero()[0]
+        data = data.induced_subgraph(members.tolist(), implementation="copy_and_delete")
+        ids = members if ids is None else ids[members]
+        labels = [labels[i] for i in members]
+        degree = degree[members]
+        membership = community_membership(data)
+        if topics is not None:
+            topics = topics[members]
+
+    server_layout = layout[len('server-'):] if layout.startswith('server-') else None
+    if data is entry.graph:
+        # built (or read from the export) once per entry
+        with stage('elements'):
+            return entry.cached_elements(budget, server_layout)
+
+    with stage('elements'):
+        if budget == -1:
+            # communities without users in the window are left out
+            elements = [element for element in quotient_elements(quotient_graph(data, membership))
+                        if element['data'].get('size', 1) > 0]
+        else:
+            elements = lod_elements(data, labels, degree, membership, budget or None, ids,
+                                    topics=topics)
+    if focused:
+        # communities inside a community are not numbered like the whole network's
+        for element in elements:
+            element['data'].pop('community', None)
+    if server_layout:
+        with stage('positions'):
+            set_positions(elements, entry.layout(server_layout), entry.membership())
+    return elements
 
-    df_in = list_to_df(inlist)
 
-    return df_in
+@app.callback(
+    Output('tblin', 'data'),
+    Output('tblin', 'page_count'),
+    Input('dropdown-update-dataset', 'value'),
+    Input('dropdown-update-interaction', 'value'),
+    Input('tblin', 'page_current'),
+    Input('tblin', 'page_size'),
+    Input('tblin', 'sort_by'))
+@instrument
+def update_tblin(dataset, value, page_current, page_size, sort_by):
+    return degree_page(dataset, value, 'in', page_current, page_size, sort_by)
 
 
 @app.callback(
     Output('tblout', 'data'),
-    Input('dropdown-update-interaction', 'value'))
-def update_tblout(value):
-    url = f'export/{main_attr}/{value}.gml'
-    data = ig.Graph.Read_GML(url)
-    labels = list(data.vs['screenname'])
-
-    _outlist = data.outdegree()
+    Output('tblout', 'page_count'),
+    Input('dropdown-update-dataset', 'value'),
+    Input('dropdown-update-interaction', 'value'),
+    Input('tblout', 'page_current'),
+    Input('tblout', 'page_size'),
+    Input('tblout', 'sort_by'))
+@instrument
+def update_tblout(dataset, value, page_current, page_size, sort_by):
+    return degree_page(dataset, value, 'out', page_current, page_size, sort_by)
 
-    outlist = list(zip(labels, _outlist))
-    outlist.sort(key=lambda i: i[1], reverse=True)
 
-    df_out = list_to_df(outlist)
-
-    return df_out
+@app.callback(
+    Output('tblcentrality', 'data'),
+    Output('tblcentrality', 'page_count'),
+    Input('dropdown-update-dataset', 'value'),
+    Input('dropdown-update-interaction', 'value'),
+    Input('dropdown-update-centrality', 'value'),
+    Input('tblcentrality', 'page_current'),
+    Input('tblcentrality', 'page_size'),
+    Input('tblcentrality', 'sort_by'))
+@instrument
+def update_tblcentrality(dataset, value, measure, page_current, page_size, sort_by):
+    return degree_page(dataset, value, measure, page_current, page_size, sort_by)
 
 
 if __name__ == '__main__':
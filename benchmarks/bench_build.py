@@ -0,0 +1,59 @@
+import time
+
+import igraph as ig
+
+from benchmarks.synthetic import synthetic_tweets
+from networks import get_edgelist, twitter_df_to_interactionnetwork
+
+
+def legacy_interactionnetwork(df, interaction_type):
+    """Network build with the former per-vertex metadata loop, kept for comparison."""
+    originaltweets = df[(df['retweeted_id'].isna())&(df['quoted_id'].isna())]
+    interactions,tuples = get_edgelist(df,interaction_type)
+    G = ig.Graph.TupleList(tuples.itertuples(index=False), directed=True,
+                           weights=False, edge_attrs=['tweetid','timestamp'])
+    id2info = df[['user_id','user_screen_name','user_followers','user_friends']].groupby('user_id').agg('last').to_dict(orient='index')
+    id2info2 = df[['retweeted_user_id','retweeted_user']].rename(columns={'retweeted_user_id':'user_id','retweeted_user':'user_screen_name'}).groupby('user_id').agg('last').to_dict(orient='index')
+    originaltweetids_dict = originaltweets[['user_id','id']].groupby('user_id')['id'].apply(list)
+    interactiontweetids_dict = interactions[['user_id','id']].groupby('user_id')['id'].apply(list)
+    for v in G.vs:
+        user_id_str = v['name']
+        try:
+            v['screen_name'] = id2info[user_id_str]['user_screen_name']
+            v['followers'] = id2info[user_id_str]['user_followers']
+            v['friends'] = id2info[user_id_str]['user_friends']
+        except KeyError:
+            v['screen_name'] = id2info2[user_id_str]['user_screen_name']
+            v['followers'] = 0
+            v['friends'] = 0
+        try:
+            v['originaltweets'] = originaltweetids_dict[user_id_str]
+        except KeyError:
+            v['originaltweets'] = "None"
+        try:
+            v['interactions'] = interactiontweetids_dict[user_id_str]
+        except KeyError:
+            v['interactions'] = "None"
+    return G
+
+
+def main(scales=(10**4, 10**5, 10**6)):
+    print(f"{'tweets':>10} {'vertices':>10} {'legacy [s]':>12} {'vectorized [s]':>15}")
+    for n in scales:
+        df = synthetic_tweets(n, max(n // 10, 100))
+
+        t = time.perf_counter()
+        G_old = legacy_interactionnetwork(df, 'retweet')
+        t_old = time.perf_counter() - t
+
+        t = time.perf_counter()
+        G_new = twitter_df_to_interactionnetwork(df, None, None, 'retweet')
+        t_new = time.perf_counter() - t
+
+        for attr in ('screen_name', 'followers', 'friends', 'originaltweets', 'interactions'):
+            assert G_old.vs[attr] == G_new.vs[attr], attr
+        print(f"{n:>10} {G_new.vcount():>10} {t_old:>12.3f} {t_new:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from text_cleaning import clean_texts
+
+
+def rowwise_clean(df):
+    """Cleaning as previously done row by row in bertopic.ipynb, kept for comparison."""
+    df = df.copy()
+    df.text = df.apply(lambda row: re.sub(r"http\S+", "", row.text).lower(), 1)
+    df.text = df.apply(lambda row: " ".join(filter(lambda x:x[0]!="@", row.text.split())), 1)
+    df.text = df.apply(lambda row: " ".join(re.sub("[^a-zA-Z]+", " ", row.text).split()), 1)
+    return df.text
+
+
+def synthetic_texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    words = np.array(["Messi", "goal!!", "@FIFAWorldCup", "https://t.co/abc123", "#Qatar2022",
+                      "RT", "what", "a", "match", "10/10", "@user_1:", "Argentina", "🏆", "it's"])
+    return [" ".join(rng.choice(words, 15)) for _ in range(n)]
+
+
+def main(scales=(10**4, 10**5, 10**6), processes=4):
+    print(f"{'texts':>10} {'row-wise [s]':>13} {'vectorized [s]':>15} {'parallel [s]':>13}")
+    for n in scales:
+        df = pd.DataFrame({'text': synthetic_texts(n)})
+
+        t = time.perf_counter()
+        expected = rowwise_clean(df)
+        t_rowwise = time.perf_counter() - t
+
+        t = time.perf_counter()
+        cleaned = clean_texts(df.text)
+        t_vectorized = time.perf_counter() - t
+
+        t = time.perf_counter()
+        cleaned_parallel = clean_texts(df.text, processes=processes)
+        t_parallel = time.perf_counter() - t
+
+        assert cleaned.equals(expected) and cleaned_parallel.equals(expected)
+        print(f"{n:>10} {t_rowwise:>13.3f} {t_vectorized:>15.3f} {t_parallel:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
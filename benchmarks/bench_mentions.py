@@ -0,0 +1,50 @@
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_tweets
+from networks import get_edgelist, string_to_list
+
+
+def legacy_mention_edgelist(df):
+    """Mention edgelist with the former per-row list split and explode, kept for comparison."""
+    interactions = df[(df['mentioned_ids'].notna())&(df['mentioned_names'].notna())]
+    interactions = interactions[(interactions['retweeted_id'].isna())&(interactions['quoted_id'].isna())&(interactions['to_userid'].isna())].copy()
+    interactions['mentioned_ids'] = interactions['mentioned_ids'].apply(string_to_list)
+    interactions['mentioned_names'] = interactions['mentioned_names'].apply(string_to_list)
+    interactions = interactions.explode(['mentioned_ids','mentioned_names'])
+    tuples = interactions[['user_id','mentioned_ids','id','timestamp_utc']]
+    tuples = tuples.rename(columns={'user_id':'source',
+                                    'mentioned_ids':'target',
+                                    'id':'tweetid',
+                                    'timestamp_utc':'timestamp'})
+    return interactions,tuples
+
+
+def check(old, new):
+    # same rows and index; the mentioned ids used to be text, they are int64 now
+    old = old.assign(**{c: old[c].astype(str) for c in ('target', 'mentioned_ids') if c in old})
+    new = new.assign(**{c: new[c].astype(str) for c in ('target', 'mentioned_ids') if c in new})
+    pd.testing.assert_frame_equal(old, new, check_dtype=False)
+
+
+def main(scales=(10**4, 10**5, 10**6)):
+    print(f"{'tweets':>10} {'mentions':>10} {'legacy [s]':>12} {'vectorized [s]':>15}")
+    for n in scales:
+        df = synthetic_tweets(n, max(n // 10, 100))
+
+        t = time.perf_counter()
+        interactions_old, tuples_old = legacy_mention_edgelist(df)
+        t_old = time.perf_counter() - t
+
+        t = time.perf_counter()
+        interactions_new, tuples_new = get_edgelist(df, 'mention')
+        t_new = time.perf_counter() - t
+
+        check(interactions_old, interactions_new)
+        check(tuples_old, tuples_new)
+        print(f"{n:>10} {len(tuples_new):>10} {t_old:>12.3f} {t_new:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import igraph as ig
+
+from benchmarks.synthetic import synthetic_tweets
+from elements import graph_elements, lod_elements
+from graph_store import GraphEntry, GraphStore
+from networks import convert_graph, get_edgelist, reduce_network, twitter_df_to_interactionnetwork
+
+
+SCALES = (10**4, 10**5, 10**6)
+BUDGET = 2000
+
+
+def measure(fn, memory=True):
+    """Run fn and return its result, wall time and Python peak memory.
+
+    Timing and memory come from separate runs, since tracemalloc slows
+    the traced run down several times.
+
+    Returns:
+    result: return value of the timed run
+    seconds (float): wall time
+    peak_mb (float): tracemalloc peak in MB, None if memory is False
+    """
+    t = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, seconds, peak_mb
+
+
+def payload(elements):
+    # what Dash sends for the elements property
+    return len(json.dumps(elements).encode())
+
+
+class Run:
+    """Collects one record per measured stage."""
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.records = []
+
+    def stage(self, case, scale, name, fn, **info):
+        result, seconds, peak_mb = measure(fn, self.memory)
+        if callable(info.get('extra')):
+            info.update(info.pop('extra')(result))
+        record = {'case': case, 'scale': scale, 'stage': name,
+                  'seconds': round(seconds, 4),
+                  'peak_mb': None if peak_mb is None else round(peak_mb, 2), **info}
+        self.records.append(record)
+        print(f"{case:>18} {scale:>10} {name:>20} {seconds:>10.3f}s "
+              f"{'' if peak_mb is None else f'{peak_mb:>9.1f}MB'}")
+        return result
+
+
+def graph_size(G):
+    return {'vertices': G.vcount(), 'edges': G.ecount()}
+
+
+def bench_synthetic(run, n, workdir):
+    df = synthetic_tweets(n, max(n // 10, 100))
+    case = 'synthetic'
+
+    run.stage(case, n, 'get_edgelist', lambda: get_edgelist(df, 'retweet'),
+              extra=lambda r: {'edges': len(r[1])})
+    run.stage(case, n, 'get_edgelist_mention', lambda: get_edgelist(df, 'mention'),
+              extra=lambda r: {'edges': len(r[1])})
+    G = run.stage(case, n, 'build', lambda: twitter_df_to_interactionnetwork(df, None, None, 'retweet'),
+                  extra=graph_size)
+    run.stage(case, n, 'build_collapsed',
+              lambda: twitter_df_to_interactionnetwork(df, None, None, 'retweet', collapse=True),
+              extra=graph_size)
+    run.stage(case, n, 'reduce', lambda: reduce_network(G, giant_component=True, aggregation='soft'),
+              extra=graph_size)
+
+    savedir = os.path.join(workdir, f'synthetic{n}')
+    os.makedirs(savedir, exist_ok=True)
+    # the export adds centrality/community attributes, so export a copy every time
+    run.stage(case, n, 'convert_graph',
+              lambda: convert_graph(G.copy(), os.path.join(savedir, 'retweet'), layouts=()))
+    store = GraphStore(workdir)
+
+    def load():
+        store.clear()
+        return store.get(f'synthetic{n}', 'retweet')
+
+    entry = run.stage(case, n, 'load_snapshot', load)
+    bench_dashboard(run, case, n, entry)
+
+
+def bench_dashboard(run, case, scale, entry):
+    # snapshot graphs keep their vertex columns outside the graph (see GraphEntry.from_snapshot)
+    columns = {'screenname': entry.labels}
+    run.stage(case, scale, 'degree_page', lambda: GraphEntry(entry.graph, columns=columns).page('in', 0, 20))
+    membership = entry.membership()
+    elements = run.stage(case, scale, 'lod_elements',
+                         lambda: lod_elements(entry.graph, entry.labels, entry.degree, membership, BUDGET),
+                         extra=lambda r: {'elements': len(r)})
+    run.stage(case, scale, 'serialize_lod', lambda: payload(elements),
+              extra=lambda r: {'bytes': r})
+    if entry.graph.vcount() + entry.graph.ecount() <= 10**5:
+        elements = run.stage(case, scale, 'graph_elements',
+                             lambda: graph_elements(entry.graph, entry.labels),
+                             extra=lambda r: {'elements': len(r)})
+        run.stage(case, scale, 'serialize_full', lambda: payload(elements),
+                  extra=lambda r: {'bytes': r})
+
+
+def bench_worldcup(run, export_dir='export/worldcup'):
+    """The shipped worldcup GML exports as a small real-data case, with scale 'gml'."""
+    for path in sorted(glob.glob(os.path.join(export_dir, '*.gml'))):
+        interaction_type = os.path.splitext(os.path.basename(path))[0]
+        # side files such as retweet.communities.gml are not interaction graphs
+        if '.' in interaction_type:
+            continue
+        case = f'worldcup-{interaction_type}'
+        G = run.stage(case, 'gml', 'read_gml', lambda: ig.Graph.Read_GML(path), extra=graph_size)
+        entry = run.stage(case, 'gml', 'graph_entry', lambda: GraphEntry(G))
+        run.stage(case, 'gml', 'reduce', lambda: reduce_network(G, giant_component=True, aggregation='soft'),
+                  extra=graph_size)
+        bench_dashboard(run, case, 'gml', entry)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """Print the time and memory ratio new / old of every stage found in both result files."""
+    def key(r):
+        return (r['case'], r['scale'], r['stage'])
+    before = {key(r): r for r in old['records']}
+    print(f"{'case':>18} {'scale':>10} {'stage':>20} {'time':>8} {'memory':>8}")
+    for r in new['records']:
+        o = before.get(key(r))
+        if o is None:
+            continue
+        time_ratio = r['seconds'] / o['seconds'] if o['seconds'] else float('nan')
+        memory_ratio = (r['peak_mb'] / o['peak_mb']
+                        if r['peak_mb'] is not None and o['peak_mb'] else float('nan'))
+        print(f"{r['case']:>18} {r['scale']:>10} {r['stage']:>20} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x")
+
+
+def main(scales=SCALES, output=None, memory=True, worldcup=True, baseline=None):
+    run = Run(memory)
+    workdir = tempfile.mkdtemp()
+    try:
+        if worldcup:
+            bench_worldcup(run)
+        for n in scales:
+            bench_synthetic(run, n, workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    results = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'igraph': ig.__version__,
+        'records': run.records,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f), results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the network build, reduce, export and dashboard stages.")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(SCALES),
+                        help="numbers of synthetic tweets")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="skip the tracemalloc runs")
+    parser.add_argument('--no-worldcup', dest='worldcup', action='store_false',
+                        help="skip the export/worldcup real-data case")
+    args = parser.parse_args()
+    main(args.scales, args.output, args.memory, args.worldcup, args.baseline)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+
+INTERACTION_MIX = {'original': 0.3, 'retweet': 0.45, 'quote': 0.05, 'reply': 0.1, 'mention': 0.1}
+
+
+def synthetic_tweets(n_tweets, n_users, mix=INTERACTION_MIX, alpha=1.2,
+                     start=1666000000, duration=7 * 24 * 3600, seed=0):
+    """Generate a twitwi-format tweet dataframe with power-law user activity.
+
+    Authors and interaction targets are drawn with probability proportional
+    to rank^-alpha, so a few accounts collect most retweets/mentions like in
+    real collections. Ids are small enough to survive the float conversion
+    pandas applies to id columns containing NaN, as with read_csv.
+
+    Parameters:
+    n_tweets (int): number of tweets
+    n_users (int): number of distinct users
+    mix (dict): share of original/retweet/quote/reply/mention tweets
+    alpha (float): power-law exponent of user popularity
+    start (int): first timestamp_utc
+    duration (int): time span of the collection in seconds
+    seed (int): random seed
+
+    Returns:
+    df (pandas dataframe): tweets in twitwi format
+    """
+    rng = np.random.default_rng(seed)
+    weights = np.arange(1, n_users + 1, dtype=np.float64) ** -alpha
+    weights /= weights.sum()
+    user_ids = np.arange(n_users, dtype=np.int64) + 10**6
+    screen_names = np.array([f"user{i}" for i in range(n_users)], dtype=object)
+
+    kinds = np.array(list(mix))
+    kind = rng.choice(kinds, size=n_tweets, p=np.array(list(mix.values())) / sum(mix.values()))
+    author = rng.choice(n_users, size=n_tweets, p=weights)
+    target = rng.choice(n_users, size=n_tweets, p=weights)
+    tweet_ids = np.arange(n_tweets, dtype=np.int64) + 10**9
+    timestamps = np.sort(rng.integers(start, start + duration, size=n_tweets))
+
+    def where(k, values):
+        out = pd.Series(values).astype(object)
+        out[kind != k] = np.nan
+        return out
+
+    # mentions carry 1-3 targets, joined with "|" like twitwi does
+    n_mentions = rng.integers(1, 4, size=n_tweets)
+    slots = rng.choice(n_users, size=(3, n_tweets), p=weights)
+    mentioned_ids = pd.Series(user_ids[slots[0]]).astype(str)
+    mentioned_names = pd.Series(screen_names[slots[0]])
+    for k in (1, 2):
+        has = pd.Series(n_mentions > k)
+        mentioned_ids += ("|" + pd.Series(user_ids[slots[k]]).astype(str)).where(has, "")
+        mentioned_names += ("|" + pd.Series(screen_names[slots[k]])).where(has, "")
+
+    df = pd.DataFrame({
+        'id': tweet_ids,
+        'timestamp_utc': timestamps,
+        'local_time': pd.to_datetime(timestamps, unit='s').astype(str),
+        'user_id': user_ids[author],
+        'user_screen_name': screen_names[author],
+        'user_followers': rng.integers(0, 10**5, size=n_tweets),
+        'user_friends': rng.integers(0, 10**4, size=n_tweets),
+        'text': [f"tweet {i} about the worldcup final" for i in range(n_tweets)],
+        'retweeted_id': where('retweet', tweet_ids - 1).astype(float),
+        'retweeted_user_id': where('retweet', user_ids[target]).astype(float),
+        'retweeted_user': where('retweet', screen_names[target]),
+        'quoted_id': where('quote', tweet_ids - 1).astype(float),
+        'quoted_user_id': where('quote', user_ids[target]).astype(float),
+        'quoted_user': where('quote', screen_names[target]),
+        'to_userid': where('reply', user_ids[target]).astype(float),
+        'to_username': where('reply', screen_names[target]),
+        'mentioned_ids': where('mention', mentioned_ids),
+        'mentioned_names': where('mention', mentioned_names),
+    })
+    return df
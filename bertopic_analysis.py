@@ -0,0 +1,162 @@
+import glob
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from text_cleaning import clean_texts
+
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CACHE_DIR = "cache/embeddings"
+
+
+class EmbeddingCache:
+    """On-disk cache of document embeddings, keyed by tweet id, for one model.
+
+    Every run that encodes new tweets adds a segment to the model's folder
+    (part-NNNNN.ids.npy / part-NNNNN.emb.npy); embeddings are memory-mapped
+    when read, so only the rows that are looked up are loaded.
+
+    Parameters:
+    cache_dir (str): root folder of the cache
+    model_name (str): name of the sentence transformer model
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, model_name=EMBEDDING_MODEL):
+        self.folder = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _segments(self):
+        for ids_path in sorted(glob.glob(os.path.join(self.folder, "part-*.ids.npy"))):
+            yield np.load(ids_path), np.load(ids_path.replace(".ids.npy", ".emb.npy"), mmap_mode="r")
+
+    def lookup(self, ids):
+        """Cached embeddings of the given tweet ids.
+
+        Parameters:
+        ids (numpy array): tweet ids
+
+        Returns:
+        found (numpy array): boolean mask of the ids that are cached
+        embeddings (numpy array): embeddings of the found ids, in the order of ids
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        rows = {}
+        for segment_ids, segment in self._segments():
+            index = pd.Index(segment_ids)
+            if index.is_unique:
+                position = index.get_indexer(ids)
+            else:
+                # segments written before ids were deduplicated: use the first row of an id
+                unique, first = np.unique(segment_ids, return_index=True)
+                position = pd.Index(unique).get_indexer(ids)
+                position = np.where(position >= 0, first[position], -1)
+            hit = (position >= 0) & ~found
+            if hit.any():
+                rows.update(zip(np.flatnonzero(hit).tolist(), segment[position[hit]]))
+                found |= hit
+        if not rows:
+            return found, np.zeros((0, 0), dtype=np.float32)
+        return found, np.stack([rows[i] for i in np.flatnonzero(found)])
+
+    def add(self, ids, embeddings):
+        """Store the embeddings of new tweet ids as a new segment."""
+        n = len(glob.glob(os.path.join(self.folder, "part-*.ids.npy")))
+        base = os.path.join(self.folder, f"part-{n:05d}")
+        np.save(base + ".emb.npy", np.asarray(embeddings, dtype=np.float32))
+        # ids last: a segment only counts once its ids file exists
+        np.save(base + ".ids.tmp.npy", np.asarray(ids, dtype=np.int64))
+        os.replace(base + ".ids.tmp.npy", base + ".ids.npy")
+
+
+def embed_tweets(ids, texts, model_name=EMBEDDING_MODEL, cache_dir=CACHE_DIR, batch_size=256,
+                 model=None):
+    """Sentence embeddings of tweets, encoding only those not cached yet.
+
+    Parameters:
+    ids (list): tweet ids
+    texts (list): (cleaned) tweet texts, aligned with ids
+    model_name (str): sentence transformer model
+    cache_dir (str): root folder of the embedding cache
+    batch_size (int): number of tweets encoded per batch
+    model (SentenceTransformer): already loaded model, loaded from model_name if needed
+
+    Returns:
+    embeddings (numpy array): float32 (tweets x dimensions) embeddings
+    """
+    cache = EmbeddingCache(cache_dir, model_name)
+    ids = np.asarray(ids, dtype=np.int64)
+    texts = list(texts)
+    found, cached = cache.lookup(ids)
+    missing = np.flatnonzero(~found)
+    # repeated tweets are encoded and cached once, then spread back to every occurrence
+    new_ids, first, inverse = np.unique(ids[missing], return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    unique_missing = missing[first]
+
+    if len(missing):
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+        batches = [
+            model.encode([texts[i] for i in unique_missing[start:start + batch_size]],
+                         batch_size=batch_size, show_progress_bar=False)
+            for start in range(0, len(unique_missing), batch_size)
+        ]
+        encoded = np.concatenate(batches).astype(np.float32)
+        cache.add(new_ids, encoded)
+        encoded = encoded[inverse]
+    else:
+        encoded = np.zeros((0, cached.shape[1]), dtype=np.float32)
+
+    dim = cached.shape[1] if found.any() else encoded.shape[1]
+    embeddings = np.empty((len(ids), dim), dtype=np.float32)
+    if found.any():
+        embeddings[found] = cached
+    embeddings[missing] = encoded
+    return embeddings
+
+
+def bertopic_analysis(name, model_name=EMBEDDING_MODEL, cache_dir=CACHE_DIR, batch_size=256,
+                      min_topic_size=35, nr_bins=20):
+    """Scripted version of the bertopic.ipynb topic modelling with cached embeddings.
+
+    Tweets are cleaned with text_cleaning.clean_texts and embedded with
+    embed_tweets, so reruns only encode tweets that were not seen before.
+    BERTopic and topics_over_time work on the precomputed embeddings.
+
+    Parameters:
+    name (str): name of the data collection, read from data/{name}.csv
+    model_name (str): sentence transformer model
+    cache_dir (str): root folder of the embedding cache
+    batch_size (int): number of tweets encoded per batch
+    min_topic_size (int): BERTopic min_topic_size
+    nr_bins (int): number of time bins of topics_over_time
+
+    Returns:
+    topic_model (BERTopic): fitted model
+    topics_over_time (pandas df): topic frequencies per time bin
+    """
+    from bertopic import BERTopic
+    from sentence_transformers import SentenceTransformer
+
+    main_attr = name
+    df = pd.read_csv(f"data/{main_attr}.csv", usecols=['id', 'text', 'local_time'])
+    tweets = clean_texts(df.text).to_list()
+    timestamps = df.local_time.to_list()
+
+    model = SentenceTransformer(model_name)
+    embeddings = embed_tweets(df.id, tweets, model_name, cache_dir, batch_size, model)
+
+    topic_model = BERTopic(embedding_model=model, min_topic_size=min_topic_size, verbose=True)
+    topics, _ = topic_model.fit_transform(tweets, embeddings)
+
+    topics_over_time = topic_model.topics_over_time(docs=tweets,
+                                                    timestamps=timestamps,
+                                                    global_tuning=True,
+                                                    evolution_tuning=True,
+                                                    nr_bins=nr_bins)
+    return topic_model, topics_over_time
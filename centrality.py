@@ -0,0 +1,83 @@
+import numpy as np
+
+
+# vertices above which betweenness is estimated from sampled pivots
+EXACT_BETWEENNESS_MAX = 5000
+BETWEENNESS_PIVOTS = 500
+
+
+def _weights(G):
+    # collapsed graphs carry the number of interactions per edge,
+    # otherwise every parallel edge counts once
+    return 'weight' if 'weight' in G.es.attributes() else None
+
+
+def pagerank(G):
+    return np.asarray(G.pagerank(directed=True, weights=_weights(G)), dtype=np.float64)
+
+
+def weighted_degree(G):
+    """Number of interactions of every vertex, in and out."""
+    return np.asarray(G.strength(mode="all", loops=True, weights=_weights(G)), dtype=np.float64)
+
+
+def coreness(G):
+    """k-core number of every vertex, on the undirected graph."""
+    return np.asarray(G.coreness(mode="all"), dtype=np.int64)
+
+
+def betweenness(G, pivots=BETWEENNESS_PIVOTS, seed=0):
+    """Betweenness of every vertex, estimated from sampled pivots on large graphs.
+
+    Up to EXACT_BETWEENNESS_MAX vertices the exact value is computed. Above
+    that, shortest paths are only started from {pivots} random source
+    vertices and the result is scaled by n / pivots (Brandes & Pich), which
+    is linear in the number of pivots instead of the number of vertices.
+
+    Parameters:
+    G (igraph graph object): graph to analyse
+    pivots (int): number of sampled source vertices
+    seed (int): seed of the pivot sample
+
+    Returns:
+    betweenness (numpy array): float betweenness per vertex
+    """
+    n = G.vcount()
+    if n <= max(EXACT_BETWEENNESS_MAX, pivots):
+        return np.asarray(G.betweenness(directed=True), dtype=np.float64)
+    sources = np.random.default_rng(seed).choice(n, size=pivots, replace=False)
+    estimate = G.betweenness(directed=True, sources=sources.tolist())
+    return np.asarray(estimate, dtype=np.float64) * (n / pivots)
+
+
+# measures offered by the dashboard, by the vertex attribute they are stored in
+CENTRALITY_MEASURES = {
+    'pagerank': pagerank,
+    'strength': weighted_degree,
+    'coreness': coreness,
+    'betweenness': betweenness,
+}
+
+
+def compute_centrality(G, measures=tuple(CENTRALITY_MEASURES)):
+    """Compute centrality measures of G.
+
+    Parameters:
+    G (igraph graph object): graph to analyse
+    measures (list): names of CENTRALITY_MEASURES to compute
+
+    Returns:
+    values (dict): numpy array per measure
+    """
+    return {name: CENTRALITY_MEASURES[name](G) for name in measures}
+
+
+def add_centrality(G, measures=tuple(CENTRALITY_MEASURES)):
+    """Store centrality measures of G as vertex attributes of the same name.
+
+    Exported with the graph (GML and snapshot columns), so the dashboard
+    reads them instead of computing them per request.
+    """
+    for name, values in compute_centrality(G, measures).items():
+        G.vs[name] = values.tolist()
+    return G
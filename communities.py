@@ -0,0 +1,135 @@
+import os
+import random
+import tempfile
+
+import igraph as ig
+import numpy as np
+
+
+COMMUNITY_METHODS = ('leiden', 'louvain')
+
+
+def undirected_projection(G):
+    """Undirected simple graph of G, weighted by the number of interactions per pair."""
+    H = G.copy()
+    H.es['weight'] = G.es['weight'] if 'weight' in G.es.attributes() else [1] * G.ecount()
+    H.to_undirected(mode="collapse", combine_edges={'weight': 'sum'})
+    H.simplify(multiple=True, loops=True, combine_edges={'weight': 'sum'})
+    return H
+
+
+def community_membership(G, method='leiden', resolution=1.0, seed=0):
+    """Community per vertex, by modularity on the undirected projection of G.
+
+    Both Leiden and Louvain (multilevel) run in near linear time, so a
+    single process handles graphs with millions of edges. Communities are
+    numbered by size, 0 being the largest.
+
+    Parameters:
+    G (igraph graph object): interaction graph
+    method (str): 'leiden' or 'louvain'
+    resolution (float): modularity resolution, higher values give smaller communities
+    seed (int): random seed, so reruns of the same export give the same partition
+
+    Returns:
+    membership (numpy array): community id per vertex
+    """
+    if G.vcount() == 0:
+        return np.zeros(0, dtype=np.int64)
+    H = undirected_projection(G)
+    ig.set_random_number_generator(random.Random(seed))
+    try:
+        if method == 'leiden':
+            clustering = H.community_leiden(objective_function="modularity", weights='weight',
+                                            resolution=resolution)
+        elif method == 'louvain':
+            clustering = H.community_multilevel(weights='weight', resolution=resolution)
+        else:
+            raise ValueError(f"unknown community detection method {method}, expected one of {COMMUNITY_METHODS}")
+    finally:
+        ig.set_random_number_generator(random)
+
+    membership = np.asarray(clustering.membership, dtype=np.int64)
+    sizes = np.bincount(membership)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+    return rank[membership]
+
+
+def quotient_graph(G, membership):
+    """Graph of the communities of G.
+
+    Every community becomes one vertex with its number of users as 'size';
+    the interactions between two communities are merged into one directed
+    edge with their count as 'weight'. Interactions inside a community are
+    dropped.
+
+    Parameters:
+    G (igraph graph object): interaction graph
+    membership (numpy array): community per vertex
+
+    Returns:
+    Q (igraph graph object): quotient graph, vertex i is community i
+    """
+    membership = np.asarray(membership, dtype=np.int64)
+    sizes = np.bincount(membership) if len(membership) else np.zeros(0, dtype=np.int64)
+    edges = np.asarray(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    weights = np.asarray(G.es['weight'] if 'weight' in G.es.attributes() else np.ones(len(edges)))
+    source, target = membership[edges[:, 0]], membership[edges[:, 1]]
+    between = source != target
+
+    pairs, inverse = np.unique(np.column_stack([source[between], target[between]]),
+                               axis=0, return_inverse=True)
+    Q = ig.Graph(n=len(sizes), edges=pairs.tolist(), directed=G.is_directed())
+    Q.vs['community'] = list(range(len(sizes)))
+    Q.vs['size'] = sizes.tolist()
+    Q.es['weight'] = np.bincount(inverse.reshape(-1), weights=weights[between],
+                                 minlength=len(pairs)).astype(np.int64).tolist()
+    return Q
+
+
+def quotient_path(savename):
+    return f"{savename}.communities.gml"
+
+
+def write_quotient_graph(G, savename, membership):
+    """Save the quotient graph of the export next to it as savename.communities.gml.
+
+    Dashboard workers may save it at once, so each one writes its own
+    temporary file before swapping it in.
+    """
+    Q = quotient_graph(G, membership)
+    path = quotient_path(savename)
+    fd, tmp = tempfile.mkstemp(suffix='.tmp', prefix=os.path.basename(path) + '.',
+                               dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        Q.write_gml(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return Q
+
+
+def read_quotient_graph(G, savename, membership, mtime=None):
+    """Saved quotient graph of the export, computed and saved if missing or stale.
+
+    Parameters:
+    G (igraph graph object): interaction graph
+    savename (str): path of the export without extension
+    membership (numpy array): community per vertex
+    mtime (float): modification time of the export, older quotient graphs are recomputed
+
+    Returns:
+    Q (igraph graph object): quotient graph, see quotient_graph
+    """
+    path = quotient_path(savename)
+    if os.path.exists(path) and (mtime is None or os.path.getmtime(path) >= mtime):
+        Q = ig.Graph.Read_GML(path)
+        if Q.vcount() == (membership.max() + 1 if len(membership) else 0):
+            # GML keeps no attributes of an empty edge set
+            if 'weight' not in Q.es.attributes():
+                Q.es['weight'] = []
+            return Q
+    return write_quotient_graph(G, savename, membership)
@@ -0,0 +1,248 @@
+import json
+import os
+
+import numpy as np
+
+from communities import community_membership, quotient_graph
+
+
+# dashboard budgets whose elements are precomputed at export, -1 being the community graph
+ELEMENT_BUDGETS = (500, 1000, 2000, 5000, -1)
+
+
+def vertex_labels(G):
+    # GML drops the underscore, graphs straight from networks.py still have it
+    return list(G.vs['screenname' if 'screenname' in G.vs.attributes() else 'screen_name'])
+
+
+def node_data(id, label, topic=None):
+    data = {'id': str(id), 'label': label}
+    if topic is not None and topic >= 0:
+        data['topic'] = int(topic)
+    return data
+
+
+def graph_elements(G, labels, ids=None, topics=None):
+    """Convert an igraph graph to Cytoscape elements.
+
+    Parameters:
+    G (igraph graph object): graph to draw
+    labels (list): label per vertex
+    ids (list): element id per vertex, defaults to the vertex index
+    topics (numpy array): topic per vertex (-1 for none), added to the node data
+
+    Returns:
+    elements (list): Cytoscape node and edge dicts
+    """
+    if ids is None:
+        ids = range(G.vcount())
+    ids = [str(x) for x in ids]
+    if topics is None:
+        topics = [None] * len(ids)
+
+    nodes = [
+        {
+            'data': node_data(short, label, topic)
+        }
+        for short, label, topic in zip(ids, labels, topics)
+    ]
+
+    edges = [
+        {'data': {'source': ids[source], 'target': ids[target]}}
+        for source, target in G.get_edgelist()
+    ]
+
+    return nodes + edges
+
+
+def quotient_elements(Q):
+    """Cytoscape elements of a community graph (see communities.quotient_graph).
+
+    Nodes and edges look like the community nodes and merged edges of
+    lod_elements, so clicking a community drills into it the same way.
+    """
+    nodes = [
+        {'data': {'id': f'c{c}', 'label': f'{int(size)} users', 'size': int(size), 'community': int(c)},
+         'classes': 'community'}
+        for c, size in enumerate(Q.vs['size'])
+    ]
+    edges = [
+        {'data': {'source': f'c{s}', 'target': f'c{t}', 'weight': int(w)},
+         'classes': 'aggregated'}
+        for (s, t), w in zip(Q.get_edgelist(), Q.es['weight'])
+    ]
+    return nodes + edges
+
+
+def _aggregate(edges, weights, labels, ids, kept, membership, max_communities, topics):
+    n = len(labels)
+
+    # communities of the hidden vertices, largest first; the rest is lumped into "other"
+    hidden = np.flatnonzero(~kept)
+    communities, sizes = np.unique(membership[hidden], return_counts=True)
+    order = np.argsort(-sizes, kind='stable')
+    communities, sizes = communities[order], sizes[order]
+    shown = communities[:max_communities]
+    other = sizes[max_communities:].sum()
+
+    # group of every vertex: itself if kept, n + position of its community otherwise
+    position = np.full(membership.max() + 1 if n else 0, len(shown), dtype=np.int64)
+    position[shown] = np.arange(len(shown))
+    group = np.where(kept, np.arange(n), n + position[membership])
+
+    nodes = [
+        {'data': node_data(ids[v], labels[v], None if topics is None else topics[v])}
+        for v in np.flatnonzero(kept)
+    ]
+    nodes += [
+        {'data': {'id': f'c{c}', 'label': f'{int(size)} users', 'size': int(size), 'community': int(c)},
+         'classes': 'community'}
+        for c, size in zip(shown, sizes[:max_communities])
+    ]
+    if other:
+        nodes.append({'data': {'id': 'c-other', 'label': f'{other} users', 'size': int(other)},
+                      'classes': 'community'})
+
+    def element_id(g):
+        if g < n:
+            return str(ids[g])
+        g -= n
+        return f'c{shown[g]}' if g < len(shown) else 'c-other'
+
+    source, target = group[edges[:, 0]], group[edges[:, 1]]
+    direct = (source < n) & (target < n)
+    edge_elements = [
+        {'data': {'source': str(ids[s]), 'target': str(ids[t])}}
+        for s, t in zip(source[direct], target[direct])
+    ]
+
+    # edges touching a community node are merged into one weighted edge per pair,
+    # edges inside a community are dropped
+    merged = ~direct & (source != target)
+    pairs, inverse = np.unique(np.column_stack([source[merged], target[merged]]),
+                               axis=0, return_inverse=True)
+    counts = np.bincount(inverse.reshape(-1), weights=weights[merged], minlength=len(pairs))
+    edge_elements += [
+        {'data': {'source': element_id(s), 'target': element_id(t), 'weight': int(w)},
+         'classes': 'aggregated'}
+        for (s, t), w in zip(pairs, counts)
+    ]
+    return nodes + edge_elements
+
+
+def lod_elements(G, labels, degree, membership, max_elements=None, ids=None,
+                 max_communities=20, topics=None):
+    """Cytoscape elements of G limited to an element budget.
+
+    If the whole graph fits into {max_elements} nodes + edges it is
+    returned as is. Otherwise only the highest degree vertices are drawn
+    and every other vertex is folded into a node for its community (the
+    {max_communities} largest ones, the rest into a single "other" node),
+    with parallel edges to these nodes merged into weighted edges. The
+    number of drawn vertices is scaled down until the budget is met.
+
+    Parameters:
+    G (igraph graph object): graph to draw
+    labels (list): label per vertex
+    degree (numpy array): degree per vertex, used to pick the drawn vertices
+    membership (numpy array): community per vertex
+    max_elements (int): element budget, None to draw everything
+    ids (list): element id per vertex, defaults to the vertex index
+    max_communities (int): maximum number of community nodes
+    topics (numpy array): topic per vertex (-1 for none), added to the node data
+
+    Returns:
+    elements (list): Cytoscape node and edge dicts
+    """
+    n = G.vcount()
+    if max_elements is None or n + G.ecount() <= max_elements:
+        return graph_elements(G, labels, ids, topics)
+    if ids is None:
+        ids = np.arange(n)
+
+    edges = np.asarray(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    # collapsed graphs already carry the number of interactions per edge
+    weights = np.asarray(G.es['weight'] if 'weight' in G.es.attributes() else np.ones(len(edges)))
+    rank = np.argsort(-np.asarray(degree), kind='stable')
+    membership = np.asarray(membership, dtype=np.int64)
+    keep_n = min(n, max_elements // 2)
+    while True:
+        kept = np.zeros(n, dtype=bool)
+        kept[rank[:keep_n]] = True
+        elements = _aggregate(edges, weights, labels, ids, kept, membership, max_communities, topics)
+        if len(elements) <= max_elements or keep_n == 0:
+            return elements
+        keep_n = min(keep_n - 1, keep_n * max_elements // len(elements))
+
+
+def set_positions(elements, positions, membership):
+    """Add preset positions to the nodes of elements.
+
+    User nodes are placed at their precomputed position, community nodes at
+    the centroid of their members.
+
+    Parameters:
+    elements (list): Cytoscape elements with vertex indices as node ids
+    positions (numpy array): (n, 2) node positions of the whole network
+    membership (numpy array): community per vertex of the whole network
+    """
+    sizes = np.bincount(membership)
+    centroids = np.column_stack([
+        np.bincount(membership, weights=positions[:, i]) / np.maximum(sizes, 1)
+        for i in range(2)
+    ])
+    center = positions.mean(axis=0) if len(positions) else np.zeros(2)
+    for element in elements:
+        data = element['data']
+        if 'source' in data:
+            continue
+        if data['id'].isdigit():
+            x, y = positions[int(data['id'])]
+        elif 'community' in data and data['community'] < len(centroids):
+            x, y = centroids[data['community']]
+        else:
+            x, y = center
+        element['position'] = {'x': float(x), 'y': float(y)}
+
+
+def serialize_elements(elements):
+    """Compact JSON of Cytoscape elements, as the dashboard serves them."""
+    return json.dumps(elements, separators=(',', ':')).encode()
+
+
+def elements_path(savename, budget):
+    return f"{savename}.elements-{'communities' if budget == -1 else budget}.json"
+
+
+def write_elements(G, savename, budgets=ELEMENT_BUDGETS, Q=None):
+    """Precompute the serialized dashboard elements of an export, one savename.elements-{budget}.json each.
+
+    The elements are those the dashboard first draws for the whole network
+    (see graph_store.GraphEntry.elements), always built from G.
+
+    Parameters:
+    G (igraph graph object): exported graph, with its community vertex attribute if detected
+    savename (str): path of the export without extension
+    budgets (list): element budgets of lod_elements, 0 for everything, -1 for the community graph
+    Q (igraph graph object): community graph of G if already built, see communities.quotient_graph
+    """
+    labels = vertex_labels(G)
+    weights = 'weight' if 'weight' in G.es.attributes() else None
+    degree = np.asarray(G.strength(mode="all", weights=weights), dtype=np.int64)
+    if 'community' in G.vs.attributes():
+        membership = np.asarray(G.vs['community'], dtype=np.int64)
+    else:
+        membership = community_membership(G)
+    topics = np.asarray(G.vs['topic'], dtype=np.int64) if 'topic' in G.vs.attributes() else None
+
+    for budget in budgets:
+        if budget == -1:
+            if Q is None:
+                Q = quotient_graph(G, membership)
+            elements = quotient_elements(Q)
+        else:
+            elements = lod_elements(G, labels, degree, membership, budget or None, topics=topics)
+        tmp = elements_path(savename, budget) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(serialize_elements(elements))
+        os.replace(tmp, elements_path(savename, budget))
@@ -0,0 +1,430 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import igraph as ig
+import numpy as np
+
+from centrality import CENTRALITY_MEASURES
+from communities import community_membership, quotient_graph, read_quotient_graph
+from elements import (elements_path, lod_elements, quotient_elements, serialize_elements,
+                      set_positions, vertex_labels)
+from layouts import compute_layout, read_layout
+from metrics import stage
+from snapshot import read_snapshot
+from temporal import TemporalIndex, read_interaction_timestamps
+
+
+EXPORT_DIR = "export"
+# SNA_MAX_GRAPHS bounds the parsed graphs a worker keeps, over all datasets
+MAX_ENTRIES = int(os.environ.get('SNA_MAX_GRAPHS', 16))
+TOPICS_FILE = "lda_topics.json"
+# edge attributes of snapshot graphs: weights and the timestamps of the time slider
+SNAPSHOT_EDGE_COLUMNS = ('weight', 'timestamp', 'first', 'last')
+
+
+def top_k(values, k):
+    """Indices of the k largest values, largest first, ties in index order.
+
+    Parameters:
+    values (numpy array): values to rank
+    k (int): number of indices to return
+
+    Returns:
+    idx (numpy array): indices into values
+    """
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < n:
+        kth = np.partition(values, n - k)[n - k]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:k - len(above)]
+        idx = np.concatenate([above, ties])
+    else:
+        idx = np.arange(n)
+    return idx[np.lexsort((idx, -values[idx]))]
+
+
+def topic_labels(lda_topics):
+    """Top words of every LDA topic, joined with "; ".
+
+    Parameters:
+    lda_topics (dict): topic number -> weighted words, as saved by lda_analysis.export_topics
+
+    Returns:
+    topics (list): one label per topic, in topic order
+    """
+    topics = [lda_topics[str(i)] for i in range(len(lda_topics))]
+    return ["; ".join(word.split("*")[1].replace('"', "") for word in topic) for topic in topics]
+
+
+class GraphEntry:
+    """Parsed interaction graph together with its precomputed degree arrays.
+
+    Attributes:
+    graph (igraph graph object): graph read from the export
+    labels (list): screen names of the vertices (an array for snapshots)
+    indegree (numpy array): in-degree per vertex (number of interactions)
+    outdegree (numpy array): out-degree per vertex (number of interactions)
+    topics (numpy array): topic per vertex (-1 for none), None if the export has no topics
+    centrality (dict): centrality measures per vertex, see centrality.py
+    community (vertex attribute): community per vertex stored with the export, see communities.py
+    savename (str): path of the export without extension, if read from one
+    mtime (float): modification time of the export
+
+    Parameters:
+    columns (dict): vertex attribute arrays used instead of the attributes of graph,
+        e.g. the memory-mapped columns of a snapshot (see from_snapshot)
+    """
+
+    def __init__(self, graph, indegree=None, outdegree=None, savename=None, mtime=None,
+                 columns=None):
+        self.graph = graph
+        self.savename = savename
+        self.mtime = mtime
+        if columns is None:
+            columns = {name: graph.vs[name] for name in graph.vs.attributes()}
+            self.labels = vertex_labels(graph)
+        else:
+            self.labels = columns['screenname' if 'screenname' in columns else 'screen_name']
+        self.topics = None
+        if 'topic' in columns:
+            self.topics = np.asarray(columns['topic'], dtype=np.int64)
+        # collapsed graphs count every interaction of a weighted edge
+        weights = 'weight' if 'weight' in graph.es.attributes() else None
+        if indegree is None:
+            indegree = graph.strength(mode="in", weights=weights)
+        if outdegree is None:
+            outdegree = graph.strength(mode="out", weights=weights)
+        self.indegree = np.asarray(indegree, dtype=np.int64)
+        self.outdegree = np.asarray(outdegree, dtype=np.int64)
+
+        self.centrality = {
+            name: np.asarray(columns[name])
+            for name in CENTRALITY_MEASURES if name in columns
+        }
+
+        self._rankings = {}
+        self._membership = None
+        if 'community' in columns:
+            self._membership = np.asarray(columns['community'], dtype=np.int64)
+        self._quotient = None
+        self._temporal = None
+        self._elements = {}
+        self._parsed = {}
+        self._layouts = {}
+
+    @property
+    def degree(self):
+        return self.indegree + self.outdegree
+
+    def membership(self):
+        """Community per vertex, read from the export or detected on first use."""
+        if self._membership is None:
+            self._membership = community_membership(self.graph)
+        return self._membership
+
+    def quotient(self):
+        """Graph of the communities (see communities.quotient_graph), read from or saved next to the export."""
+        if self._quotient is None:
+            if self.savename is None:
+                self._quotient = quotient_graph(self.graph, self.membership())
+            else:
+                self._quotient = read_quotient_graph(self.graph, self.savename,
+                                                     self.membership(), self.mtime)
+        return self._quotient
+
+    def temporal(self):
+        """TemporalIndex over the interactions (see temporal.py), built on first use.
+
+        Collapsed exports are indexed by the interaction timestamps saved with them.
+        """
+        if self._temporal is None:
+            timestamps = None
+            if self.savename is not None:
+                timestamps = read_interaction_timestamps(self.graph, self.savename)
+            self._temporal = TemporalIndex(self.graph, timestamps=timestamps)
+        return self._temporal
+
+    def degrees(self, mode):
+        """In- or out-degree array for mode 'in' / 'out', else the centrality measure {mode}.
+
+        Measures missing from the export are computed on first use and kept
+        with the entry.
+        """
+        if mode == 'in':
+            return self.indegree
+        if mode == 'out':
+            return self.outdegree
+        if mode not in self.centrality:
+            self.centrality[mode] = CENTRALITY_MEASURES[mode](self.graph)
+        return self.centrality[mode]
+
+    def ranking(self, mode, k, ascending=False):
+        """Indices of the first k vertices ordered by degree.
+
+        Ties keep the vertex order, as a stable sort would. Only the top k
+        are selected (with a partition) and sorted; the longest prefix
+        computed so far is kept, so paging forward reuses it.
+
+        Parameters:
+        mode (str): 'in', 'out' or a centrality measure
+        k (int): number of vertices needed
+        ascending (boolean): lowest degrees first instead of highest
+
+        Returns:
+        ranking (numpy array): vertex indices
+        """
+        key = (mode, ascending)
+        ranked = self._rankings.get(key)
+        if ranked is None or len(ranked) < min(k, len(self.labels)):
+            ranked = top_k(-self.degrees(mode) if ascending else self.degrees(mode), k)
+            self._rankings[key] = ranked
+        return ranked[:k]
+
+    def label_order(self):
+        """Vertex indices sorted by screen name, computed once per entry."""
+        if 'label' not in self._rankings:
+            self._rankings['label'] = np.argsort(np.asarray(self.labels, dtype=str), kind='stable')
+        return self._rankings['label']
+
+    def page(self, mode, page, page_size, by_label=False, ascending=False):
+        """Screen names and degrees of one page of the degree table.
+
+        Parameters:
+        mode (str): 'in', 'out' or a centrality measure
+        page (int): page number, starting at 0
+        page_size (int): rows per page
+        by_label (boolean): order by screen name instead of degree
+        ascending (boolean): ascending instead of descending order
+
+        Returns:
+        rows (list): (screen name, value) tuples of the page
+        """
+        start = page * page_size
+        if by_label:
+            order = self.label_order()
+            idx = order[start:start + page_size] if ascending else order[::-1][start:start + page_size]
+        else:
+            idx = self.ranking(mode, start + page_size, ascending)[start:]
+        values = self.degrees(mode)
+        if values.dtype.kind == 'f':
+            return [(self.labels[i], round(float(values[i]), 6)) for i in idx]
+        return [(self.labels[i], int(values[i])) for i in idx]
+
+    def layout(self, name):
+        """Server-side node positions ('drl' / 'fr'), read from or saved next to the export."""
+        if name not in self._layouts:
+            if self.savename is None:
+                self._layouts[name] = compute_layout(self.graph, name)
+            else:
+                self._layouts[name] = read_layout(self.graph, self.savename, name, self.mtime)
+        return self._layouts[name]
+
+    def elements(self, budget, layout=None):
+        """Cytoscape elements of the whole network as first shown by the dashboard.
+
+        Parameters:
+        budget (int): element budget of lod_elements, 0 for everything,
+            -1 for the community graph only
+        layout (str): server layout ('drl' / 'fr') whose positions are added, None for none
+
+        Returns:
+        elements (list): Cytoscape node and edge dicts
+        """
+        if budget == -1:
+            elements = quotient_elements(self.quotient())
+        else:
+            elements = lod_elements(self.graph, self.labels, self.degree, self.membership(),
+                                    budget or None, topics=self.topics)
+        if layout is not None:
+            set_positions(elements, self.layout(layout), self.membership())
+        return elements
+
+    def elements_json(self, budget, layout=None):
+        """Serialized elements (see elements) and their content hash, built once per entry.
+
+        Element files precomputed by elements.write_elements are read instead of
+        building the elements when they are not older than the export.
+
+        Returns:
+        body (bytes): JSON of the elements
+        etag (str): hash of body
+        """
+        key = (budget, layout)
+        if key not in self._elements:
+            path = None if self.savename is None else elements_path(self.savename, budget)
+            if (layout is None and path is not None and os.path.exists(path)
+                    and (self.mtime is None or os.path.getmtime(path) >= self.mtime)):
+                with open(path, 'rb') as f:
+                    body = f.read()
+            else:
+                body = serialize_elements(self.elements(budget, layout))
+            self._elements[key] = (body, hashlib.sha1(body).hexdigest()[:16])
+        return self._elements[key]
+
+    def cached_elements(self, budget, layout=None):
+        """Elements of elements_json as a list, parsed once per entry, for the dashboard callbacks."""
+        key = (budget, layout)
+        if key not in self._parsed:
+            self._parsed[key] = json.loads(self.elements_json(budget, layout)[0])
+        return self._parsed[key]
+
+    @classmethod
+    def from_snapshot(cls, path, savename=None, mtime=None):
+        """Entry of a binary snapshot whose vertex columns stay memory-mapped.
+
+        The igraph graph only gets the structure and the edge attributes the
+        dashboard uses; labels, topics, communities and centrality are read
+        from the mapped arrays, so workers share their pages instead of each
+        holding Python lists of them.
+        """
+        snap = read_snapshot(path)
+        G = snap.to_graph(vertex_columns=(), edge_columns=SNAPSHOT_EDGE_COLUMNS)
+        return cls(G, snap.indegree(), snap.outdegree(), savename, mtime, columns=snap.vertex)
+
+
+class GraphStore:
+    """Process-wide cache of parsed interaction graphs.
+
+    Binary snapshots (see snapshot.py) are preferred over the GML export
+    when both exist. Entries are keyed by (dataset, interaction type, file
+    mtime), so a re-exported file is picked up on the next lookup, and the
+    least recently used entry is evicted once more than {max_entries} graphs
+    are held, whatever dataset they belong to. Datasets are the subfolders
+    of export_dir holding at least one interaction graph; nothing is read
+    before a dataset is first used.
+
+    Parameters:
+    export_dir (str): folder containing one subfolder per dataset
+    max_entries (int): maximum number of parsed graphs kept in memory
+    """
+
+    def __init__(self, export_dir=EXPORT_DIR, max_entries=MAX_ENTRIES):
+        self.export_dir = export_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._topics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path(self, dataset, interaction_type):
+        return os.path.join(self.export_dir, dataset, f"{interaction_type}.gml")
+
+    def snapshot_path(self, dataset, interaction_type):
+        return os.path.join(self.export_dir, dataset, f"{interaction_type}.snap")
+
+    def interaction_types(self, dataset):
+        """Interaction types exported for a dataset, as GML or snapshot."""
+        folder = os.path.join(self.export_dir, dataset)
+        if not os.path.isdir(folder):
+            return set()
+        types = set()
+        for name in os.listdir(folder):
+            stem, ext = os.path.splitext(name)
+            # side files (layouts, communities, elements) have a second extension
+            if '.' in stem:
+                continue
+            if ext == '.gml' or (ext == '.snap' and os.path.exists(os.path.join(folder, name, 'meta.json'))):
+                types.add(stem)
+        return types
+
+    def datasets(self):
+        """Sorted names of the export subfolders holding at least one interaction graph."""
+        if not os.path.isdir(self.export_dir):
+            return []
+        return sorted(name for name in os.listdir(self.export_dir) if self.interaction_types(name))
+
+    def is_dataset(self, dataset):
+        """Whether dataset names a subfolder of export_dir, without scanning the other datasets."""
+        return (bool(dataset) and os.path.isdir(self.export_dir)
+                and dataset in os.listdir(self.export_dir))
+
+    def has(self, dataset, interaction_type):
+        """Whether interaction_type is exported for dataset, e.g. to validate request parameters."""
+        return self.is_dataset(dataset) and interaction_type in self.interaction_types(dataset)
+
+    def topics(self, dataset):
+        """LDA topic labels of a dataset (see topic_labels), read on first use.
+
+        Returns:
+        topics (list): one label per topic, empty if the dataset has no topics
+        """
+        path = os.path.join(self.export_dir, dataset, TOPICS_FILE)
+        if not os.path.exists(path):
+            return []
+        key = (dataset, os.path.getmtime(path))
+        with self._lock:
+            topics = self._topics.get(key)
+            if topics is not None:
+                self._topics.move_to_end(key)
+                return topics
+
+        with open(path, "r") as f:
+            topics = topic_labels(json.load(f))
+
+        with self._lock:
+            for stale in [k for k in self._topics if k[0] == dataset and k != key]:
+                del self._topics[stale]
+            self._topics[key] = topics
+            while len(self._topics) > self.max_entries:
+                self._topics.popitem(last=False)
+        return topics
+
+    def get(self, dataset, interaction_type):
+        """Return the GraphEntry for one interaction graph, parsing it on first use.
+
+        Parameters:
+        dataset (str): name of the export subfolder, e.g. "worldcup"
+        interaction_type (str): retweet/quote/reply/mention
+
+        Returns:
+        entry (GraphEntry): cached graph and degree arrays
+        """
+        snap = self.snapshot_path(dataset, interaction_type)
+        if os.path.exists(os.path.join(snap, 'meta.json')):
+            mtime = os.path.getmtime(os.path.join(snap, 'meta.json'))
+        else:
+            snap = None
+            mtime = os.path.getmtime(self.path(dataset, interaction_type))
+        key = (dataset, interaction_type, mtime)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        # parse outside the lock so other datasets are not blocked meanwhile
+        savename = os.path.join(self.export_dir, dataset, interaction_type)
+        with stage('parse'):
+            if snap is not None:
+                entry = GraphEntry.from_snapshot(snap, savename, mtime)
+            else:
+                entry = GraphEntry(ig.Graph.Read_GML(self.path(dataset, interaction_type)),
+                                   savename=savename, mtime=mtime)
+
+        with self._lock:
+            for stale in [k for k in self._entries if k[:2] == key[:2] and k != key]:
+                del self._entries[stale]
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._topics.clear()
+
+
+store = GraphStore()
+
+
+def get_graph(dataset, interaction_type):
+    """Shortcut for store.get on the process-wide GraphStore."""
+    return store.get(dataset, interaction_type)
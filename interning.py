@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def as_user_ids(values):
+    """Twitter user ids as int64, whether they come as int, float (columns with NaN) or str."""
+    values = pd.Series(values)
+    if values.dtype == object:
+        values = pd.to_numeric(values.astype(str))
+    return values.to_numpy().astype(np.int64)
+
+
+def intern_user_ids(source, target):
+    """Number the users of an edgelist.
+
+    Vertices are numbered in order of first appearance, row by row, like
+    ig.Graph.TupleList does with vertex names, so a compact network has the
+    same vertex order as the one built from names.
+
+    Parameters:
+    source, target (pandas series): user ids of the edge endpoints
+
+    Returns:
+    users (numpy array): int64 user id of every vertex
+    source, target (numpy array): vertex index of every edge endpoint
+    """
+    pairs = np.column_stack([as_user_ids(source), as_user_ids(target)])
+    codes, users = pd.factorize(pairs.ravel())
+    codes = codes.reshape(-1, 2)
+    return np.asarray(users, dtype=np.int64), codes[:, 0], codes[:, 1]
+
+
+def csr_lists(keys, values, users):
+    """Group values by user id as offsets + values arrays in vertex order.
+
+    Parameters:
+    keys (pandas series): user id per value
+    values (pandas series): values to group, e.g. tweet ids
+    users (numpy array): user id of every vertex, keys of other users are dropped
+
+    Returns:
+    indptr (numpy array): the values of vertex v are values[indptr[v]:indptr[v + 1]]
+    values (numpy array): int64 values grouped by vertex, in their original order
+    """
+    index = pd.Index(users).get_indexer(as_user_ids(keys))
+    known = index >= 0
+    index, values = index[known], np.asarray(values)[known]
+    order = np.argsort(index, kind='stable')
+    indptr = np.zeros(len(users) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(index, minlength=len(users)), out=indptr[1:])
+    return indptr, values[order].astype(np.int64)
+
+
+class VertexTable:
+    """User id <-> vertex index table of a compact network, with the tweet ids of every user.
+
+    Replaces the name, originaltweets and interactions vertex attributes:
+    ids are one int64 array and the tweet id lists of all users are two
+    offsets + values arrays, instead of a Python object per user.
+
+    Attributes:
+    users (numpy array): int64 user id of every vertex
+    originaltweets (tuple): (indptr, tweetids) of the original tweets per vertex
+    interactions (tuple): (indptr, tweetids) of the interaction tweets per vertex
+    """
+
+    def __init__(self, users, originaltweets, interactions):
+        self.users = np.asarray(users, dtype=np.int64)
+        self.originaltweets = originaltweets
+        self.interactions = interactions
+        self._index = None
+
+    def __len__(self):
+        return len(self.users)
+
+    def index_of(self, user_ids):
+        """Vertex index of every user id, -1 for users not in the network."""
+        if self._index is None:
+            self._index = pd.Index(self.users)
+        return self._index.get_indexer(as_user_ids(user_ids))
+
+    def tweets(self, v, kind='originaltweets'):
+        """Tweet ids of vertex v, kind being 'originaltweets' or 'interactions'."""
+        indptr, tweetids = getattr(self, kind)
+        return tweetids[indptr[v]:indptr[v + 1]]
+
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, users=self.users,
+                 originaltweets_indptr=self.originaltweets[0],
+                 originaltweets=self.originaltweets[1],
+                 interactions_indptr=self.interactions[0],
+                 interactions=self.interactions[1])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['users'],
+                       (f['originaltweets_indptr'], f['originaltweets']),
+                       (f['interactions_indptr'], f['interactions']))
+
+
+def table_path(savename):
+    return f"{savename}.users.npz"
+
+
+def write_vertex_table(table, savename):
+    """Save the vertex table of a compact network next to it as savename.users.npz."""
+    table.save(table_path(savename))
+
+
+def read_vertex_table(savename):
+    """Vertex table saved by write_vertex_table."""
+    return VertexTable.load(table_path(savename))
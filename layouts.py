@@ -0,0 +1,79 @@
+import os
+import tempfile
+
+import numpy as np
+
+
+# layouts computed on the server, by the name used in the layout dropdown
+SERVER_LAYOUTS = {
+    'drl': lambda G: G.layout_drl(),
+    'fr': lambda G: G.layout_fruchterman_reingold(grid=True),
+}
+
+
+def compute_layout(G, name):
+    """Node positions of G computed with one of the SERVER_LAYOUTS.
+
+    Both DrL and Fruchterman-Reingold with grid acceleration scale to large
+    graphs. Positions are rescaled to roughly 50 pixels per node on each
+    axis of a square, so Cytoscape can use them as a preset layout.
+
+    Parameters:
+    G (igraph graph object): graph to lay out
+    name (str): 'drl' or 'fr'
+
+    Returns:
+    positions (numpy array): (n, 2) float32 x/y coordinates
+    """
+    if G.vcount() == 0:
+        return np.zeros((0, 2), dtype=np.float32)
+    coords = np.asarray(SERVER_LAYOUTS[name](G).coords, dtype=np.float64)
+    coords -= coords.min(axis=0)
+    span = coords.max()
+    if span > 0:
+        coords *= 50 * np.sqrt(G.vcount()) / span
+    return coords.astype(np.float32)
+
+
+def layout_path(savename, name):
+    return f"{savename}.layout-{name}.npy"
+
+
+def write_layout(G, savename, name):
+    """Compute a server layout and save it next to the export as savename.layout-{name}.npy.
+
+    Dashboard workers may save the same layout at once, so each one writes
+    its own temporary file before swapping it in.
+    """
+    positions = compute_layout(G, name)
+    path = layout_path(savename, name)
+    fd, tmp = tempfile.mkstemp(suffix='.tmp.npy', prefix=os.path.basename(path) + '.',
+                               dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    try:
+        np.save(tmp, positions)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return positions
+
+
+def read_layout(G, savename, name, mtime=None):
+    """Saved positions of a server layout, computed and saved if missing or stale.
+
+    Parameters:
+    G (igraph graph object): graph the positions belong to
+    savename (str): path of the export without extension
+    name (str): 'drl' or 'fr'
+    mtime (float): modification time of the export, older layouts are recomputed
+
+    Returns:
+    positions (numpy array): (n, 2) x/y coordinates
+    """
+    path = layout_path(savename, name)
+    if os.path.exists(path) and (mtime is None or os.path.getmtime(path) >= mtime):
+        positions = np.load(path)
+        if len(positions) == G.vcount():
+            return positions
+    return write_layout(G, savename, name)
@@ -3,14 +3,98 @@ from gensim import corpora, models, similarities
 import tempfile
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from nltk.corpus import stopwords
 from string import punctuation
 import json 
+from text_cleaning import clean_texts
+import numpy as np
+
+CUSTOM_STOPWORDS = ['RT','rt', 'diwali']
+
+# share of unknown tokens in an update above which a full retraining is advised
+RETRAIN_THRESHOLD = 0.2
+
+
+def get_stoplist(custom_stopwords=CUSTOM_STOPWORDS):
+        """Stopwords, punctuation and custom stopwords as a set for constant time lookups."""
+        return set(stopwords.words('english')) | set(punctuation) | set(custom_stopwords)
+
+
+def tokenize(documents, stoplist, clean=False):
+        """Lowercase and split documents, removing the words in stoplist.
+
+        Parameters:
+        documents (list): tweet texts
+        stoplist (set): words to remove
+        clean (boolean): strip links, mentions and non-letters first, see text_cleaning.py
+
+        Returns:
+        texts (list): list of tokens per document
+        """
+        if clean:
+                documents = clean_texts(documents)
+        return [[word for word in str(document).lower().split() if word not in stoplist] for document in documents]
+
+
+def iter_tokenized_chunks(path, stoplist, chunksize=100000, processes=None, columns=(), clean=False):
+        """Stream a CSV file chunk by chunk together with its tokenized tweets.
+
+        The CSV is read {chunksize} tweets at a time and every chunk is split
+        into one batch per process of a tokenizer pool.
+
+        Parameters:
+        path (str): CSV file in twitwi format
+        stoplist (set): words to remove
+        chunksize (int): number of tweets read per chunk
+        processes (int): number of tokenizer processes, defaults to the number of CPUs
+        columns (list): further columns to read along with text
+        clean (boolean): clean the texts before tokenizing, see tokenize
+
+        Returns:
+        yields (chunk, texts): the chunk as pandas df and the list of tokens of every tweet
+        """
+        processes = processes or os.cpu_count()
+        with ProcessPoolExecutor(processes) as pool:
+                for chunk in pd.read_csv(path, usecols=['text', *columns], chunksize=chunksize):
+                        documents = chunk['text'].tolist()
+                        step = max(1, -(-len(documents) // processes))
+                        batches = [documents[i:i + step] for i in range(0, len(documents), step)]
+                        texts = []
+                        for batch in pool.map(partial(tokenize, stoplist=stoplist, clean=clean), batches):
+                                texts.extend(batch)
+                        yield chunk, texts
+
+
+def iter_tokenized(path, stoplist, chunksize=100000, processes=None, clean=False):
+        """Stream the tokenized tweets of a CSV file, see iter_tokenized_chunks.
+
+        Returns:
+        yields the list of tokens of every tweet, in file order
+        """
+        for _, texts in iter_tokenized_chunks(path, stoplist, chunksize, processes, clean=clean):
+                yield from texts
+
+
+def export_topics(lda, corpus, main_attr, total_topics):
+        """Print the topic coherence and save the topics to export/{main_attr}/lda_topics.json."""
+        #Show first n important word in the topics:
+        top_topics = lda.show_topics(10,5,log=False, formatted=True)
+        top_topic = lda.top_topics(corpus)
+
+        avg_topic_coherence = sum([t[1] for t in top_topic]) / total_topics
+        print("Average topic coherence: %.4f." % avg_topic_coherence)   
+
+        lda_topics = {i[0]: i[1].split(" + ") for i in lda.print_topics(-1)}
+
+        with open(f"export/{main_attr}/lda_topics.json", "w") as f:
+                json.dump(lda_topics, f)
+
 
 def lda_analysis(name):
 
         main_attr = name
-        custom_stopwords = ['RT','rt', 'diwali']
 
         df = pd.read_csv(f"data/{main_attr}.csv")
         df.head()
@@ -33,9 +117,9 @@ def lda_analysis(name):
 
 
         # removing common words and tokenizing
-        stoplist = stopwords.words('english') + list(punctuation) + custom_stopwords
+        stoplist = get_stoplist()
 
-        texts = [[word for word in str(document).lower().split() if word not in stoplist] for document in corpus]
+        texts = tokenize(corpus, stoplist)
 
         dictionary = corpora.Dictionary(texts)
         dictionary.save(os.path.join(TEMP_FOLDER, f'{main_attr}.dict'))
@@ -52,17 +136,246 @@ def lda_analysis(name):
         lda = models.LdaModel(corpus, id2word=dictionary, num_topics=total_topics)
         corpus_lda = lda[corpus_tfidf] # create a double wrapper over the original corpus: bow->tfidf->fold-in-lsi
 
-        #Show first n important word in the topics:
-        top_topics = lda.show_topics(10,5,log=False, formatted=True)
-        top_topic = lda.top_topics(corpus)
+        export_topics(lda, corpus, main_attr, total_topics)
 
-        avg_topic_coherence = sum([t[1] for t in top_topic]) / total_topics
-        print("Average topic coherence: %.4f." % avg_topic_coherence)   
 
-        lda_topics = {i[0]: i[1].split(" + ") for i in lda.print_topics(-1)}
+def lda_pipeline(name, workers=None, passes=1, total_topics=15, chunksize=100000, processes=None,
+                 clean=False, train_chunksize=2000):
+        """Streaming, multi-core variant of lda_analysis for large collections.
+
+        Tweets are streamed from data/{name}.csv and tokenized in a process
+        pool. Tokens are spooled to a temporary file while the dictionary is
+        built, then converted to bag-of-words straight into the MmCorpus on
+        disk, and LdaMulticore trains on that disk-backed corpus. Only one
+        chunk of tweets is held in memory at a time.
+
+        Parameters:
+        name (str): name of the data collection
+        workers (int): LdaMulticore worker processes, defaults to the number of CPUs - 1
+        passes (int): passes over the corpus during training
+        total_topics (int): number of topics
+        chunksize (int): number of tweets read per chunk
+        processes (int): number of tokenizer processes, defaults to the number of CPUs
+        clean (boolean): strip links, mentions and non-letters before tokenizing
+        train_chunksize (int): documents per LdaMulticore training chunk, small enough
+            that every worker gets chunks and each pass makes many updates
+
+        Returns:
+        lda (gensim LdaMulticore): trained model, topics saved to export/{name}/lda_topics.json
+        """
+        main_attr = name
+        TEMP_FOLDER = tempfile.gettempdir()
+        logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+        stoplist = get_stoplist()
+        dictionary = corpora.Dictionary()
+        tokens_path = os.path.join(TEMP_FOLDER, f'{main_attr}.tokens')
+        with open(tokens_path, 'w', encoding='utf-8') as f:
+                batch = []
+                for text in iter_tokenized(f"data/{main_attr}.csv", stoplist, chunksize, processes, clean):
+                        f.write(" ".join(text) + "\n")
+                        batch.append(text)
+                        if len(batch) == chunksize:
+                                dictionary.add_documents(batch)
+                                batch = []
+                dictionary.add_documents(batch)
+        dictionary.save(os.path.join(TEMP_FOLDER, f'{main_attr}.dict'))
+
+        def bows():
+                with open(tokens_path, encoding='utf-8') as f:
+                        for line in f:
+                                yield dictionary.doc2bow(line.split())
+
+        corpus_path = os.path.join(TEMP_FOLDER, f'{main_attr}.mm')
+        corpora.MmCorpus.serialize(corpus_path, bows())
+        os.remove(tokens_path)
+        corpus = corpora.MmCorpus(corpus_path)
+
+        lda = models.LdaMulticore(corpus, id2word=dictionary, num_topics=total_topics,
+                                  workers=workers, passes=passes, chunksize=train_chunksize)
+
+        save_state(lda, dictionary, main_attr, clean)
+        export_topics(lda, corpus, main_attr, total_topics)
+        return lda
+
+
+def state_paths(main_attr):
+        """Paths of the persisted dictionary and LDA model of a data collection."""
+        folder = f"export/{main_attr}/lda"
+        return os.path.join(folder, 'lda.dict'), os.path.join(folder, 'lda.model')
+
+
+def save_state(lda, dictionary, main_attr, clean=False):
+        """Persist dictionary and model to export/{main_attr}/lda for later updates.
+
+        The tokenizer settings (clean) are saved along in lda.json, so updates
+        and inference tokenize like the training did.
+        """
+        dict_path, model_path = state_paths(main_attr)
+        os.makedirs(os.path.dirname(dict_path), exist_ok=True)
+        dictionary.save(dict_path)
+        lda.save(model_path)
+        with open(os.path.join(os.path.dirname(dict_path), 'lda.json'), 'w') as f:
+                json.dump({'clean': clean}, f)
+
+
+def saved_clean(main_attr):
+        """clean setting the persisted model was trained with, False for models saved without it."""
+        path = os.path.join(os.path.dirname(state_paths(main_attr)[0]), 'lda.json')
+        if not os.path.exists(path):
+                return False
+        with open(path) as f:
+                return json.load(f).get('clean', False)
+
+
+def lda_update(name, path, chunksize=100000, processes=None, clean=None):
+        """Update the persisted LDA model of a data collection with new tweets only.
+
+        The dictionary and model saved by lda_pipeline are loaded, the new
+        tweets are tokenized and added to the dictionary, and the model is
+        updated online with their bag-of-words before both are saved again
+        and the topics are re-exported.
+
+        LDA cannot grow its vocabulary, so words first seen in the update
+        are kept in the dictionary (a later retraining picks them up) but
+        left out of the online update. A warning is logged once their share
+        of the tokens exceeds RETRAIN_THRESHOLD.
+
+        Parameters:
+        name (str): name of the data collection
+        path (str): CSV file with the new tweets in twitwi format
+        chunksize (int): number of tweets read per chunk
+        processes (int): number of tokenizer processes, defaults to the number of CPUs
+        clean (boolean): clean the texts before tokenizing, defaults to the setting of the training
+
+        Returns:
+        lda (gensim LdaModel): updated model, topics saved to export/{name}/lda_topics.json
+        """
+        main_attr = name
+        TEMP_FOLDER = tempfile.gettempdir()
+        logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+        dict_path, model_path = state_paths(main_attr)
+        dictionary = corpora.Dictionary.load(dict_path)
+        lda = models.LdaModel.load(model_path)
+        if clean is None:
+                clean = saved_clean(main_attr)
+
+        stoplist = get_stoplist()
+        counts = {'known': 0, 'unknown': 0}
+
+        def bows():
+                batch = []
+                for text in iter_tokenized(path, stoplist, chunksize, processes, clean):
+                        batch.append(text)
+                        if len(batch) == chunksize:
+                                yield from known_bows(batch)
+                                batch = []
+                yield from known_bows(batch)
+
+        def known_bows(batch):
+                # pruning would renumber the word ids the trained model relies on
+                dictionary.add_documents(batch, prune_at=None)
+                for text in batch:
+                        bow = dictionary.doc2bow(text)
+                        known = [(i, n) for i, n in bow if i < lda.num_terms]
+                        counts['known'] += sum(n for _, n in known)
+                        counts['unknown'] += sum(n for _, n in bow) - sum(n for _, n in known)
+                        yield known
+
+        corpus_path = os.path.join(TEMP_FOLDER, f'{main_attr}.update.mm')
+        corpora.MmCorpus.serialize(corpus_path, bows())
+        corpus = corpora.MmCorpus(corpus_path)
+
+        lda.update(corpus)
+
+        total = counts['known'] + counts['unknown']
+        if total and counts['unknown'] / total > RETRAIN_THRESHOLD:
+                logging.warning("%.0f%% of the new tokens are not in the model vocabulary, "
+                                "consider retraining with lda_pipeline", 100 * counts['unknown'] / total)
+
+        save_state(lda, dictionary, main_attr, clean)
+        export_topics(lda, corpus, main_attr, lda.num_topics)
+        return lda
+
+
+def topics_paths(main_attr):
+        """Folder of the per-tweet and per-user topic arrays of a data collection."""
+        return f"export/{main_attr}/topics"
+
+
+def infer_topics(name, path=None, lda=None, dictionary=None, chunksize=10000, processes=None,
+                 clean=None):
+        """Infer the topic distribution of every tweet and aggregate it per user.
+
+        Tweets are streamed from the CSV and inferred {chunksize} at a time,
+        with results written into memory-mapped arrays, so memory stays
+        bounded by the chunk size and the number of users. The folder
+        export/{name}/topics receives:
+        tweet_id.npy, user_id.npy: ids per tweet, in file order
+        distribution.npy: float32 (tweets x topics) topic distribution
+        dominant.npy: int16 most likely topic per tweet
+        users.npy, user_distribution.npy: user ids and their mean topic distribution
+
+        Parameters:
+        name (str): name of the data collection
+        path (str): CSV file in twitwi format, defaults to data/{name}.csv
+        lda (gensim LdaModel): model to use, defaults to the one saved by lda_pipeline
+        dictionary (gensim Dictionary): dictionary of the model, loaded with it by default
+        chunksize (int): number of tweets inferred per batch
+        processes (int): number of tokenizer processes, defaults to the number of CPUs
+        clean (boolean): clean the texts before tokenizing, defaults to the setting saved
+            with the model by lda_pipeline
+
+        Returns:
+        folder (str): path of the topics folder
+        """
+        main_attr = name
+        path = path or f"data/{main_attr}.csv"
+        if lda is None:
+                dict_path, model_path = state_paths(main_attr)
+                dictionary = corpora.Dictionary.load(dict_path)
+                lda = models.LdaModel.load(model_path)
+        if clean is None:
+                clean = saved_clean(main_attr)
+
+        n_docs = sum(len(chunk) for chunk in pd.read_csv(path, usecols=['id'], chunksize=10**6))
+        folder = topics_paths(main_attr)
+        os.makedirs(folder, exist_ok=True)
+        open_memmap = np.lib.format.open_memmap
+        tweet_id = open_memmap(os.path.join(folder, 'tweet_id.npy'), mode='w+', dtype=np.int64, shape=(n_docs,))
+        user_id = open_memmap(os.path.join(folder, 'user_id.npy'), mode='w+', dtype=np.int64, shape=(n_docs,))
+        distribution = open_memmap(os.path.join(folder, 'distribution.npy'), mode='w+',
+                                   dtype=np.float32, shape=(n_docs, lda.num_topics))
+        dominant = open_memmap(os.path.join(folder, 'dominant.npy'), mode='w+', dtype=np.int16, shape=(n_docs,))
+
+        user_sums = None
+        start = 0
+        for chunk, texts in iter_tokenized_chunks(path, get_stoplist(), chunksize, processes, ['id', 'user_id'],
+                                                  clean=clean):
+                bows = [[(i, n) for i, n in dictionary.doc2bow(text) if i < lda.num_terms] for text in texts]
+                gamma, _ = lda.inference(bows)
+                gamma /= gamma.sum(axis=1, keepdims=True)
+                end = start + len(chunk)
+                tweet_id[start:end] = chunk['id'].to_numpy()
+                user_id[start:end] = chunk['user_id'].to_numpy()
+                distribution[start:end] = gamma
+                dominant[start:end] = gamma.argmax(axis=1)
+
+                sums = pd.DataFrame(gamma, index=chunk['user_id'].to_numpy()).groupby(level=0).sum()
+                sums['count'] = chunk.groupby('user_id').size()
+                user_sums = sums if user_sums is None else user_sums.add(sums, fill_value=0)
+                start = end
+
+        for arr in (tweet_id, user_id, distribution, dominant):
+                arr.flush()
+        user_sums = user_sums.sort_index()
+        counts = user_sums.pop('count').to_numpy()[:, None]
+        np.save(os.path.join(folder, 'users.npy'), user_sums.index.to_numpy(dtype=np.int64))
+        np.save(os.path.join(folder, 'user_distribution.npy'),
+                (user_sums.to_numpy() / counts).astype(np.float32))
+        return folder
 
-        with open(f"export/{main_attr}/lda_topics.json", "w") as f:
-                json.dump(lda_topics, f)
 
 if __name__ == "__main__":
-        lda_analysis("worldcup")
\ No newline at end of file
+        lda_analysis("worldcup")
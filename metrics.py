@@ -0,0 +1,180 @@
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from flask import Response
+from plotly.io.json import to_json_plotly
+
+
+# SNA_METRICS=1 turns the timing on, SNA_METRICS_LOG=1 also logs every callback
+ENABLED = os.environ.get('SNA_METRICS', '') not in ('', '0')
+LOG = os.environ.get('SNA_METRICS_LOG', '') not in ('', '0')
+
+# histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Process-wide timing histograms per (callback, stage) and payload sizes per callback.
+
+    With gunicorn every worker keeps its own numbers; Prometheus tells the
+    workers apart by the instance it scrapes.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._bytes = {}
+
+    def observe(self, callback, stage, seconds):
+        with self._lock:
+            # cumulative bucket counts, sum, count
+            histogram = self._durations.setdefault((callback, stage), [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def observe_bytes(self, callback, size):
+        with self._lock:
+            total, count = self._bytes.get(callback, (0, 0))
+            self._bytes[callback] = (total + size, count + 1)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP sna_stage_seconds Time spent per dashboard callback and stage.',
+            '# TYPE sna_stage_seconds histogram',
+        ]
+        with self._lock:
+            for (callback, stage), (counts, total, count) in sorted(self._durations.items()):
+                labels = f'callback="{callback}",stage="{stage}"'
+                for bound, n in zip(self.buckets, counts):
+                    lines.append(f'sna_stage_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'sna_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'sna_stage_seconds_sum{{{labels}}} {total}')
+                lines.append(f'sna_stage_seconds_count{{{labels}}} {count}')
+            lines += [
+                '# HELP sna_payload_bytes JSON size of the callback outputs.',
+                '# TYPE sna_payload_bytes summary',
+            ]
+            for callback, (total, count) in sorted(self._bytes.items()):
+                lines.append(f'sna_payload_bytes_sum{{callback="{callback}"}} {total}')
+                lines.append(f'sna_payload_bytes_count{{callback="{callback}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._bytes.clear()
+
+
+metrics = Metrics()
+_current = threading.local()
+
+
+@contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(getattr(_current, 'callback', 'none'), name, time.perf_counter() - start)
+
+
+def stage(name):
+    """Context manager timing one stage (e.g. 'parse', 'compute') of the running callback."""
+    return _timed_stage(name) if ENABLED else nullcontext()
+
+
+def instrument(fn):
+    """Time a Dash callback and the JSON serialization of its outputs.
+
+    Records the 'callback' and 'serialize' stages and the payload size.
+    The outputs are serialized with the encoder Dash uses, once more than
+    Dash itself does, so this only happens while metrics are enabled;
+    otherwise fn is returned unchanged.
+    """
+    if not ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        name = fn.__name__
+        _current.callback = name
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.observe(name, 'callback', seconds)
+            _current.callback = 'none'
+
+        start = time.perf_counter()
+        size = len(to_json_plotly(result))
+        serialize = time.perf_counter() - start
+        metrics.observe(name, 'serialize', serialize)
+        metrics.observe_bytes(name, size)
+        if LOG:
+            logger.info("%s: %.3fs callback, %.3fs serialize, %d bytes", name, seconds, serialize, size)
+        return result
+
+    return wrapper
+
+
+def instrument_route(fn):
+    """Time a Flask view and record the size of the body it sends.
+
+    Records the 'request' stage and the payload size of views that serve
+    callback data directly (e.g. /elements); 304 responses count with an
+    empty body. fn is returned unchanged while metrics are disabled.
+    """
+    if not ENABLED:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        name = fn.__name__
+        _current.callback = name
+        start = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            metrics.observe(name, 'request', seconds)
+            _current.callback = 'none'
+
+        size = len(response.get_data()) if hasattr(response, 'get_data') else 0
+        metrics.observe_bytes(name, size)
+        if LOG:
+            logger.info("%s: %.3fs, %d bytes (%s)", name, seconds, size,
+                        getattr(response, 'status_code', ''))
+        return response
+
+    return wrapper
+
+
+def register_metrics(server, path='/metrics', auth=None):
+    """Serve the metrics on the Flask server of the dashboard, if enabled.
+
+    auth (dash_auth Auth) is checked on every scrape: older dash-auth
+    releases only protect the routes that exist when they are set up.
+    """
+    if not ENABLED:
+        return
+    if LOG:
+        logging.basicConfig(level=logging.INFO)
+
+    def prometheus_metrics():
+        if auth is not None and not auth.is_authorized():
+            return auth.login_request()
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    server.add_url_rule(path, 'metrics', prometheus_metrics)
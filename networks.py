@@ -1,10 +1,100 @@
+import os
+import re
+from functools import reduce
+from itertools import chain
+
 import igraph as ig
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
 import warnings
 
+from centrality import CENTRALITY_MEASURES, add_centrality
+from communities import community_membership, write_quotient_graph
+from elements import write_elements
+from interning import VertexTable, as_user_ids, csr_lists, intern_user_ids, write_vertex_table
+from layouts import write_layout
+from snapshot import write_snapshot
+from temporal import write_interaction_timestamps
+
+
+INTERACTION_TYPES = ['mention','retweet','reply','quote']
+
+# columns of the twitwi CSV read by get_edgelist, per interaction type
+EDGELIST_COLUMNS = {
+    'retweet': ['user_id','retweeted_id','retweeted_user_id','id','timestamp_utc'],
+    'quote': ['user_id','quoted_id','quoted_user_id','id','timestamp_utc'],
+    'reply': ['user_id','to_userid','id','timestamp_utc'],
+    'mention': ['user_id','mentioned_ids','mentioned_names','retweeted_id','quoted_id',
+                'to_userid','id','timestamp_utc'],
+}
+
+# columns needed for the node metadata (user_info / target_info / original tweets)
+METADATA_COLUMNS = {
+    'retweet': ['user_screen_name','user_followers','user_friends','retweeted_user','quoted_id'],
+    'quote': ['user_screen_name','user_followers','user_friends','quoted_user','retweeted_id'],
+    'reply': ['user_screen_name','user_followers','user_friends','to_username',
+              'retweeted_id','quoted_id'],
+    'mention': ['user_screen_name','user_followers','user_friends'],
+}
+
+# dtypes of the chunked CSV reads: inferred per chunk, a chunk of single mentions
+# would be numeric and the optional id columns int64 or float64 depending on gaps
+CSV_DTYPES = {
+    'mentioned_ids': str, 'mentioned_names': str,
+    'retweeted_id': 'float64', 'retweeted_user_id': 'float64',
+    'quoted_id': 'float64', 'quoted_user_id': 'float64', 'to_userid': 'float64',
+}
+
 
 def string_to_list(string):
     return string.split("|")
 
+
+def split_column(values, sep="|"):
+    """Split every string of a column at sep in one pass.
+
+    The strings are joined and split once instead of building a list per
+    row, and the number of parts per row gives the row of every part.
+
+    Parameters:
+    values (pandas series): strings to split
+    sep (str): separator
+
+    Returns:
+    parts (numpy array): all parts, row after row
+    counts (numpy array): number of parts per row
+    """
+    counts = values.str.count(re.escape(sep)).to_numpy(dtype=np.int64) + 1
+    parts = np.array(sep.join(values.tolist()).split(sep), dtype=object) if len(values) else np.zeros(0, dtype=object)
+    return parts, counts
+
+
+def explode_mentions(interactions):
+    """One row per mentioned user, with the mentioned ids as int64.
+
+    Parameters:
+    interactions (pandas df): tweets with "|"-separated mentioned_ids/mentioned_names
+
+    Returns:
+    interactions (pandas df): the tweets repeated once per mention, mentioned_ids and
+    mentioned_names holding a single user each, index kept as with DataFrame.explode
+    """
+    ids, counts = split_column(interactions['mentioned_ids'])
+    names, name_counts = split_column(interactions['mentioned_names'])
+    if not np.array_equal(counts, name_counts):
+        raise ValueError("mentioned_ids and mentioned_names have different numbers of users")
+    # Twitter ids are numeric; keep them as text otherwise
+    ids = pd.Series(ids, dtype=object)
+    if ids.str.isdigit().all():
+        ids = ids.astype(np.int64)
+
+    rows = np.repeat(np.arange(len(interactions)), counts)
+    interactions = interactions.iloc[rows].copy()
+    interactions['mentioned_ids'] = ids.to_numpy()
+    interactions['mentioned_names'] = names
+    return interactions
+
 def get_edgelist(df,interaction_type):
     """Generate an edgelist from a Twitter CSV data collection.
 
@@ -35,15 +125,13 @@ def get_edgelist(df,interaction_type):
         interactions = df[df['to_userid'].notna()]
         tuples = interactions[['user_id','to_userid','id','timestamp_utc']]
         tuples = tuples.rename(columns={'user_id':'source',
-                                        'to_user_id':'target',
+                                        'to_userid':'target',
                                         'id':'tweetid',
                                         'timestamp_utc':'timestamp'})
     elif interaction_type == 'mention':
         interactions = df[(df['mentioned_ids'].notna())&(df['mentioned_names'].notna())]
         interactions = interactions[(interactions['retweeted_id'].isna())&(interactions['quoted_id'].isna())&(interactions['to_userid'].isna())]
-        interactions['mentioned_ids'] = interactions['mentioned_ids'].apply(string_to_list)
-        interactions['mentioned_names'] = interactions['mentioned_names'].apply(string_to_list)        
-        interactions = interactions.explode(['mentioned_ids','mentioned_names'])
+        interactions = explode_mentions(interactions)
         tuples = interactions[['user_id','mentioned_ids','id','timestamp_utc']]
         tuples = tuples.rename(columns={'user_id':'source',
                                         'mentioned_ids':'target',
@@ -53,6 +141,213 @@ def get_edgelist(df,interaction_type):
     return interactions,tuples
 
 
+def filter_timerange(df, starttime, endtime):
+    """Reduce df to the tweets between starttime and endtime (both included), if given."""
+    if starttime != None and endtime != None:
+        df = df[(df['timestamp_utc'] >= starttime) & (df['timestamp_utc']<= endtime)]
+    return df
+
+
+def user_info(df):
+    """Last known screen name / followers / friends per tweeting user.
+
+    Parameters:
+    df (pandas dataframe): dataframe containing the tweets in twitwi format
+
+    Returns:
+    id2info (pandas df): user_screen_name/user_followers/user_friends indexed by user_id
+    """
+    return df[['user_id','user_screen_name','user_followers','user_friends']].groupby('user_id').agg('last')
+
+
+def target_info(df, interactions, interaction_type):
+    """Last known screen name per interaction target (retweeted/quoted/replied/mentioned user).
+
+    Parameters:
+    df (pandas dataframe): dataframe containing the tweets in twitwi format
+    interactions (pandas df): interactions returned by get_edgelist
+    interaction_type (str): retweet/quote/reply/mention
+
+    Returns:
+    id2info2 (pandas df): user_screen_name indexed by user_id
+    """
+    if interaction_type == 'retweet':
+        cols = df[['retweeted_user_id','retweeted_user']]
+    elif interaction_type == 'quote':
+        cols = df[['quoted_user_id','quoted_user']]
+    elif interaction_type == 'reply':
+        cols = df[['to_userid','to_username']]
+    elif interaction_type == 'mention':
+        cols = interactions[['mentioned_ids','mentioned_names']]
+    cols.columns = ['user_id','user_screen_name']
+    return cols.groupby('user_id').agg('last')
+
+
+def tweetids_per_user(tweets):
+    """List of tweet ids per user_id.
+
+    Same result as groupby('user_id')['id'].apply(list), but splits one
+    sorted id array at the group boundaries instead of building a
+    sub-series per user.
+
+    Parameters:
+    tweets (pandas df): tweets with user_id and id columns
+
+    Returns:
+    tweetids (pandas series): list of tweet ids indexed by user_id
+    """
+    tweets = tweets[['user_id','id']].sort_values('user_id', kind='stable')
+    keys, starts = np.unique(tweets['user_id'].to_numpy(), return_index=True)
+    ids = np.split(tweets['id'].to_numpy(), starts[1:]) if len(keys) else []
+    return pd.Series([a.tolist() for a in ids], index=keys, dtype=object)
+
+
+def collapse_edgelist(tuples, remove_self_loops=True):
+    """Merge the parallel edges of an edgelist into one weighted edge per user pair.
+
+    One groupby over (source, target) replaces the per-tweet edges, so the
+    graph is built from the distinct pairs only. The tweet ids of every
+    pair are kept in one array, grouped in edge order, instead of lists on
+    the edges: the tweets of edge i are tweetids[indptr[i]:indptr[i + 1]]
+    with indptr = [0, cumsum(weight)].
+
+    Parameters:
+    tuples (pandas df): source/target/tweetid/timestamp edgelist from get_edgelist
+    remove_self_loops (boolean): drop interactions of users with themselves
+
+    Returns:
+    edges (pandas df): source/target/weight/first/last edgelist, weight being the
+    number of interactions and first/last their earliest/latest timestamp
+    tweetids (numpy array): tweet ids of all interactions, grouped by edge
+    """
+    if remove_self_loops:
+        source, target = tuples['source'], tuples['target']
+        if source.dtype == target.dtype:
+            loops = source == target
+        elif is_numeric_dtype(source) and is_numeric_dtype(target):
+            # int64 users against float64 targets (ids read from a CSV with gaps)
+            loops = pd.Series(as_user_ids(source) == as_user_ids(target))
+        else:
+            loops = source.map(_name_key) == target.map(_name_key)
+        tuples = tuples[~loops.to_numpy()]
+
+    tuples = tuples.sort_values(['source','target','timestamp'], kind='stable')
+    edges = tuples.groupby(['source','target'], sort=False).agg(weight=('tweetid','size'),
+                                                                 first=('timestamp','min'),
+                                                                 last=('timestamp','max'))
+    return edges.reset_index(), tuples['tweetid'].to_numpy()
+
+
+def fill_node_metadata(G, id2info, id2info2, originaltweetids, interactiontweetids):
+    """Set screen_name/followers/friends/originaltweets/interactions on all vertices at once.
+
+    Vertex names are joined against the grouped frames in one reindex per
+    column. Users that never tweeted themselves get the target screen name
+    and 0 followers/friends; users without tweets get the string "None".
+
+    Parameters:
+    G (igraph graph object): interaction network with user ids as vertex names
+    id2info (pandas df): output of user_info
+    id2info2 (pandas df): output of target_info
+    originaltweetids (pandas series): list of original tweet ids per user_id
+    interactiontweetids (pandas series): list of interaction tweet ids per user_id
+    """
+    names = pd.Index(G.vs['name'])
+    set_user_metadata(G, names, id2info, id2info2)
+
+    G.vs['originaltweets'] = [x if isinstance(x, list) else "None"
+                              for x in originaltweetids.reindex(names)]
+    G.vs['interactions'] = [x if isinstance(x, list) else "None"
+                            for x in interactiontweetids.reindex(names)]
+
+
+def set_user_metadata(G, names, id2info, id2info2):
+    """Set screen_name/followers/friends of the vertices with the given user ids, see fill_node_metadata."""
+    info = id2info.reindex(names)
+    known = names.isin(id2info.index)
+
+    screen_name = info['user_screen_name'].where(known, id2info2['user_screen_name'].reindex(names))
+    G.vs['screen_name'] = screen_name.tolist()
+    for col, attr in (('user_followers', 'followers'), ('user_friends', 'friends')):
+        values = info[col].where(known, 0)
+        if pd.api.types.is_integer_dtype(id2info[col].dtype):
+            values = values.astype(id2info[col].dtype)
+        G.vs[attr] = values.tolist()
+
+
+def build_interactionnetwork(tuples, id2info, id2info2, originaltweetids, interactiontweetids,
+                             collapse=False, return_tweetids=False):
+    """Create the igraph graph from an edgelist and fill out the node metadata.
+
+    Parameters:
+    tuples (pandas df): source/target/tweetid/timestamp edgelist from get_edgelist
+    id2info, id2info2, originaltweetids, interactiontweetids: see fill_node_metadata
+    collapse (boolean): one weighted edge per user pair instead of one edge per tweet,
+    with weight/first/last edge attributes and without self loops, see collapse_edgelist
+    return_tweetids (boolean): also return the tweet ids grouped by edge (collapse only)
+
+    Returns:
+    G (igraph graph object): interaction network
+    tweetids (numpy array): tweet ids grouped by edge, only if return_tweetids is True
+    """
+    if collapse:
+        tuples, tweetids = collapse_edgelist(tuples)
+        edge_attrs = ['weight','first','last']
+    else:
+        tweetids = None
+        edge_attrs = ['tweetid','timestamp']
+    G = ig.Graph.TupleList(tuples.itertuples(index=False), 
+                           directed=True, 
+                           weights=False,
+                           edge_attrs=edge_attrs
+                           ) 
+    fill_node_metadata(G, id2info, id2info2, originaltweetids, interactiontweetids)
+    if return_tweetids:
+        return G, tweetids
+    return G
+
+
+def build_compactnetwork(tuples, id2info, id2info2, originaltweets, interactions, collapse=False):
+    """Create the igraph graph with interned integer user ids and fill out the node metadata.
+
+    Unlike build_interactionnetwork, the vertices carry no name and no tweet
+    id lists: user ids are interned into one int64 table and the tweet ids of
+    every user are kept as offsets + values arrays in a VertexTable (see
+    interning.py). Only screen_name/followers/friends stay vertex attributes.
+    Vertices are in the same order as in build_interactionnetwork.
+
+    Parameters:
+    tuples (pandas df): source/target/tweetid/timestamp edgelist from get_edgelist
+    id2info, id2info2: see fill_node_metadata
+    originaltweets (pandas df): original tweets with user_id and id columns
+    interactions (pandas df): interaction tweets with user_id and id columns
+    collapse (boolean): one weighted edge per user pair, see build_interactionnetwork
+
+    Returns:
+    G (igraph graph object): interaction network
+    table (VertexTable): user id and tweet ids per vertex
+    tweetids (numpy array): tweet ids grouped by edge if collapse, else None
+    """
+    tweetids = None
+    if collapse:
+        tuples, tweetids = collapse_edgelist(tuples)
+        edge_attrs = ['weight','first','last']
+    else:
+        edge_attrs = ['tweetid','timestamp']
+    users, source, target = intern_user_ids(tuples['source'], tuples['target'])
+    G = ig.Graph(n=len(users), edges=np.column_stack([source, target]).tolist(), directed=True)
+    for attr in edge_attrs:
+        G.es[attr] = tuples[attr].tolist()
+
+    # target ids may come as text (mentions), join them as integers too
+    id2info2 = id2info2.set_axis(as_user_ids(id2info2.index)).groupby(level=0).agg('last')
+    set_user_metadata(G, pd.Index(users), id2info, id2info2)
+    table = VertexTable(users,
+                        csr_lists(originaltweets['user_id'], originaltweets['id'], users),
+                        csr_lists(interactions['user_id'], interactions['id'], users))
+    return G, table, tweetids
+
+
 # -----------------------------------------------------------------
 # -----------------------------------------------------------------
 # main part
@@ -61,7 +356,8 @@ def get_edgelist(df,interaction_type):
 def twitter_df_to_interactionnetwork(df,
                                      starttime,
                                      endtime,
-                                     interaction_type
+                                     interaction_type,
+                                     collapse=False
                                      ):
     """Generate Interaction Network from Twitter CSV data collection.
 
@@ -69,68 +365,310 @@ def twitter_df_to_interactionnetwork(df,
     df (pandas dataframe): dataframe containing the tweets in twitwi format
     starttime (int): use retweets beginning on that date [timestamp]
     endtime (int): use retweets until on that date (including that last day) [timestamp]
+    collapse (boolean): one weighted edge per user pair, see build_interactionnetwork
     
     Returns:
     G (igraph graph object): retweet network where a link is created
     from i to j if i retweeted j
     """    
     
-    idf = df.copy()
-    
-    # reduce to the desired timerange
-    if starttime != None and endtime != None:
-        idf = idf[(idf['timestamp_utc'] >= starttime) & (idf['timestamp_utc']<= endtime)]    
-    
+    return twitter_df_to_interactionnetworks(df, starttime, endtime, [interaction_type],
+                                             collapse)[interaction_type]
+
+
+def twitter_df_to_interactionnetworks(df,
+                                      starttime,
+                                      endtime,
+                                      interaction_types=INTERACTION_TYPES,
+                                      collapse=False,
+                                      return_tweetids=False
+                                      ):
+    """Generate several Interaction Networks from one Twitter CSV data collection.
+
+    The timerange filter, the original tweets and the user metadata are
+    computed once and shared by all interaction types; only the edgelist
+    and the target screen names are extracted per type.
+
+    Parameters:
+    df (pandas dataframe): dataframe containing the tweets in twitwi format
+    starttime (int): use retweets beginning on that date [timestamp]
+    endtime (int): use retweets until on that date (including that last day) [timestamp]
+    interaction_types (list): any of retweet/quote/reply/mention
+    collapse (boolean): one weighted edge per user pair, see build_interactionnetwork
+    return_tweetids (boolean): also return the tweet ids grouped by edge (collapse only)
+
+    Returns:
+    networks (dict): igraph graph object per interaction type
+    tweetids (dict): tweet ids grouped by edge per interaction type,
+    only if return_tweetids is True
+    """
+    # reduce to the desired timerange (boolean indexing already copies)
+    idf = filter_timerange(df, starttime, endtime)
+
     originaltweets = idf[(idf['retweeted_id'].isna())&(idf['quoted_id'].isna())]
-    interactions,tuples = get_edgelist(idf,interaction_type)
-    
-    G = ig.Graph.TupleList(tuples.itertuples(index=False), 
-                           directed=True, 
-                           weights=False,
-                           edge_attrs=['tweetid','timestamp']
-                           ) 
-                                  
-    ## fill out the node metadata
-    id2info = df[['user_id','user_screen_name','user_followers','user_friends']].groupby('user_id').agg('last').to_dict(orient='index')
-    if interaction_type == 'retweet':
-        id2info2 = df[['retweeted_user_id','retweeted_user']].rename(columns={'retweeted_user_id':'user_id','retweeted_user':'user_screen_name'}).groupby('user_id').agg('last').to_dict(orient='index')
-    elif interaction_type == 'quote':
-        id2info2 = df[['quoted_user_id','quoted_user']].rename(columns={'quoted_user_id':'user_id','quoted_user':'user_screen_name'}).groupby('user_id').agg('last').to_dict(orient='index')
-    elif interaction_type == 'reply':
-        id2info2 = df[['to_userid','to_username']].rename(columns={'to_userid':'user_id','to_username':'user_screen_name'}).groupby('user_id').agg('last').to_dict(orient='index')
-    elif interaction_type == 'mention':
-        id2info2 = interactions[['mentioned_ids','mentioned_names']].rename(columns={'mentioned_ids':'user_id','mentioned_names':'user_screen_name'}).groupby('user_id').agg('last').to_dict(orient='index')
-
-    originaltweetids_dict = originaltweets[['user_id','id']].groupby('user_id')['id'].apply(list)
-    interactiontweetids_dict = interactions[['user_id','id']].groupby('user_id')['id'].apply(list)        
-
-    for v in G.vs:
-        user_id_str = v['name']
-        try:
-            v['screen_name'] = id2info[user_id_str]['user_screen_name']
-            v['followers'] = id2info[user_id_str]['user_followers']
-            v['friends'] = id2info[user_id_str]['user_friends']
-        except KeyError:
-            v['screen_name'] = id2info2[user_id_str]['user_screen_name']     
-            v['followers'] = 0
-            v['friends'] = 0   
-        try:
-            v['originaltweets'] = originaltweetids_dict[user_id_str]
-        except KeyError:
-            v['originaltweets'] = "None"
-        try:
-            v['interactions'] = interactiontweetids_dict[user_id_str]
-        except KeyError:
-            v['interactions'] = "None"    
-            
-    return G
+    originaltweetids_dict = tweetids_per_user(originaltweets)
+    id2info = user_info(df)
+
+    networks = {}
+    tweetids = {}
+    for interaction_type in interaction_types:
+        interactions,tuples = get_edgelist(idf,interaction_type)
+        id2info2 = target_info(df, interactions, interaction_type)
+        networks[interaction_type], tweetids[interaction_type] = build_interactionnetwork(
+            tuples, id2info, id2info2, originaltweetids_dict, tweetids_per_user(interactions),
+            collapse, return_tweetids=True)
+    if return_tweetids:
+        return networks, tweetids
+    return networks
+
+
+def twitter_df_to_compactnetworks(df,
+                                  starttime,
+                                  endtime,
+                                  interaction_types=INTERACTION_TYPES,
+                                  collapse=False
+                                  ):
+    """Generate compact Interaction Networks (see build_compactnetwork) from one data collection.
+
+    Parameters:
+    df (pandas dataframe): dataframe containing the tweets in twitwi format
+    starttime (int): use retweets beginning on that date [timestamp]
+    endtime (int): use retweets until on that date (including that last day) [timestamp]
+    interaction_types (list): any of retweet/quote/reply/mention
+    collapse (boolean): one weighted edge per user pair, see build_interactionnetwork
+
+    Returns:
+    networks (dict): (graph, vertex table, edge tweet ids) per interaction type
+    """
+    idf = filter_timerange(df, starttime, endtime)
+
+    originaltweets = idf.loc[(idf['retweeted_id'].isna())&(idf['quoted_id'].isna()), ['user_id','id']]
+    id2info = user_info(df)
+
+    networks = {}
+    for interaction_type in interaction_types:
+        interactions,tuples = get_edgelist(idf,interaction_type)
+        id2info2 = target_info(df, interactions, interaction_type)
+        networks[interaction_type] = build_compactnetwork(tuples, id2info, id2info2, originaltweets,
+                                                          interactions[['user_id','id']], collapse)
+    return networks
+
+
+def attach_user_topics(G, folder, users=None):
+    """Set the topic vertex attributes from the per-user topics of lda_analysis.infer_topics.
+
+    Parameters:
+    G (igraph graph object): interaction network with user ids as vertex names
+    folder (str): topics folder written by infer_topics, e.g. export/worldcup/topics
+    users (numpy array): user id per vertex for compact networks without names
+
+    Returns:
+    sets topic (most likely topic, -1 for users without tweets) and
+    topic_distribution (mean topic distribution, "None" for users without tweets)
+    """
+    topic_users = np.load(os.path.join(folder, 'users.npy'))
+    distribution = np.load(os.path.join(folder, 'user_distribution.npy'), mmap_mode='r')
+    row = pd.Series(np.arange(len(topic_users)), index=[_name_key(u) for u in topic_users])
+    names = G.vs['name'] if users is None else users
+    rows = row.reindex([_name_key(name) for name in names]).to_numpy()
+    known = ~np.isnan(rows)
+    rows = np.where(known, rows, 0).astype(np.int64)
+
+    topic = np.full(len(rows), -1, dtype=np.int64)
+    dist = np.asarray(distribution[rows]) if len(topic_users) else np.zeros((len(rows), 0))
+    if known.any():
+        topic[known] = dist[known].argmax(axis=1)
+    G.vs['topic'] = topic.tolist()
+    G.vs['topic_distribution'] = [d.tolist() if k else "None" for d, k in zip(dist, known)]
+
+
+def export_interactionnetworks(df,
+                               savedir,
+                               starttime=None,
+                               endtime=None,
+                               interaction_types=INTERACTION_TYPES,
+                               topics=None,
+                               collapse=False,
+                               compact=False
+                               ):
+    """Build all interaction networks in one run and save them with convert_graph.
+
+    Parameters:
+    df (pandas dataframe): dataframe containing the tweets in twitwi format
+    savedir (str): folder to save the networks to, e.g. export/worldcup
+    starttime (int): use retweets beginning on that date [timestamp]
+    endtime (int): use retweets until on that date (including that last day) [timestamp]
+    interaction_types (list): any of retweet/quote/reply/mention
+    topics (str): topics folder of lda_analysis.infer_topics, to attach the user topics
+    collapse (boolean): one weighted edge per user pair, the tweet ids of every edge
+    are saved to {savedir}/{interaction_type}.tweetids.npy (see collapse_edgelist) and
+    their timestamps to {savedir}/{interaction_type}.timestamps.npy (see temporal.TemporalIndex)
+    compact (boolean): build with interned user ids (see build_compactnetwork), the vertex
+    table is saved to {savedir}/{interaction_type}.users.npz
+
+    Returns:
+    networks (dict): igraph graph object per interaction type,
+    saved to {savedir}/{interaction_type}.*, with the state update_export continues
+    from for networks with one edge per tweet and named vertices (see write_update_state)
+    """
+    os.makedirs(savedir, exist_ok=True)
+    if compact:
+        built = twitter_df_to_compactnetworks(df, starttime, endtime, interaction_types, collapse)
+        networks = {t: G for t, (G, _, _) in built.items()}
+        tables = {t: table for t, (_, table, _) in built.items()}
+        tweetids = {t: ids for t, (_, _, ids) in built.items()}
+    else:
+        networks, tweetids = twitter_df_to_interactionnetworks(df, starttime, endtime,
+                                                               interaction_types, collapse,
+                                                               return_tweetids=True)
+    users = None if collapse or compact else user_table(df, starttime, endtime)
+    if collapse:
+        tweettimes = df.drop_duplicates('id').set_index('id')['timestamp_utc']
+    for interaction_type, G in networks.items():
+        if topics is not None:
+            attach_user_topics(G, topics, tables[interaction_type].users if compact else None)
+        savename = os.path.join(savedir, interaction_type)
+        if collapse:
+            write_edge_tweetids(tweetids[interaction_type], savename)
+            write_interaction_timestamps(tweettimes.reindex(tweetids[interaction_type]).to_numpy(), savename)
+        if compact:
+            write_vertex_table(tables[interaction_type], savename)
+        convert_graph(G, savename)
+        if not (collapse or compact):
+            write_update_state(G, users, savename)
+    return networks
+
+
+def tweetids_path(savename):
+    return f"{savename}.tweetids.npy"
+
+
+def write_edge_tweetids(tweetids, savename):
+    """Save the tweet ids of a collapsed network, grouped by edge, to savename.tweetids.npy."""
+    tmp = tweetids_path(savename) + '.tmp.npy'
+    np.save(tmp, np.asarray(tweetids, dtype=np.int64))
+    os.replace(tmp, tweetids_path(savename))
+
+
+def read_edge_tweetids(G, savename):
+    """Tweet ids of every edge of a collapsed network saved by export_interactionnetworks.
+
+    Parameters:
+    G (igraph graph object): collapsed network with the weight edge attribute
+    savename (str): path of the export without extension
+
+    Returns:
+    indptr (numpy array): the tweets of edge i are tweetids[indptr[i]:indptr[i + 1]]
+    tweetids (numpy array): tweet ids grouped by edge, memory-mapped
+    """
+    indptr = np.zeros(G.ecount() + 1, dtype=np.int64)
+    np.cumsum(np.asarray(G.es['weight'], dtype=np.int64), out=indptr[1:])
+    return indptr, np.load(tweetids_path(savename), mmap_mode='r')
+
+
+def _combine_last(acc, part):
+    # last non-null value per user over the chunks seen so far
+    if acc is None:
+        return part
+    return pd.concat([acc, part]).groupby(level=0).agg('last')
+
+
+def twitter_csv_to_interactionnetwork(path,
+                                      starttime,
+                                      endtime,
+                                      interaction_type,
+                                      chunksize=10**6,
+                                      collapse=False,
+                                      return_tweetids=False
+                                      ):
+    """Generate Interaction Network from a Twitter CSV file without loading it at once.
+
+    The CSV is read in chunks restricted to the columns needed for the
+    edgelist and the node metadata. Each chunk is filtered to the timerange,
+    its edges and tweet ids are kept and the user metadata is merged into
+    running per-user tables, so peak memory follows the number of edges
+    rather than the size of the CSV. The result is the same graph as
+    twitter_df_to_interactionnetwork on the full dataframe.
+
+    Parameters:
+    path (str): CSV file in twitwi format
+    starttime (int): use retweets beginning on that date [timestamp]
+    endtime (int): use retweets until on that date (including that last day) [timestamp]
+    interaction_type (str): retweet/quote/reply/mention
+    chunksize (int): number of tweets read per chunk
+    collapse (boolean): one weighted edge per user pair, see build_interactionnetwork
+    return_tweetids (boolean): also return the tweet ids grouped by edge (collapse only)
+
+    Returns:
+    G (igraph graph object): interaction network
+    tweetids (numpy array): tweet ids grouped by edge, only if return_tweetids is True
+    """
+    usecols = sorted(set(EDGELIST_COLUMNS[interaction_type]) | set(METADATA_COLUMNS[interaction_type]))
+
+    edges = []
+    originaltweets = []
+    interactions = []
+    id2info = None
+    id2info2 = None
+    dtype = {column: CSV_DTYPES[column] for column in usecols if column in CSV_DTYPES}
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtype, chunksize=chunksize):
+        id2info = _combine_last(id2info, user_info(chunk))
+
+        chunk_in_range = filter_timerange(chunk, starttime, endtime)
+        chunk_interactions, tuples = get_edgelist(chunk_in_range, interaction_type)
+        id2info2 = _combine_last(id2info2, target_info(chunk, chunk_interactions, interaction_type))
+
+        edges.append(tuples)
+        originaltweets.append(chunk_in_range.loc[(chunk_in_range['retweeted_id'].isna())&(chunk_in_range['quoted_id'].isna()), ['user_id','id']])
+        interactions.append(chunk_interactions[['user_id','id']])
+
+    return build_interactionnetwork(pd.concat(edges, ignore_index=True), id2info, id2info2,
+                                    tweetids_per_user(pd.concat(originaltweets, ignore_index=True)),
+                                    tweetids_per_user(pd.concat(interactions, ignore_index=True)),
+                                    collapse, return_tweetids)
+
+
+def aggregation_mask(G, aggregation, hard_agg_threshold=0):
+    """Vertices that survive one 'soft' or 'hard' aggregation pass.
+
+    In-degree and the number of distinct out-neighbours are computed for all
+    vertices at once in igraph (the latter on a simplified copy that merges
+    parallel edges) instead of one degree/neighbors call per vertex.
+
+    Parameters:
+    G (igraph graph object): retweet / mentions network
+    aggregation (str): 'soft' or 'hard', see reduce_network
+    hard_agg_threshold(int)
+
+    Returns:
+    keep (numpy array): boolean mask over the vertices of G
+    """
+    indegree = np.asarray(G.indegree(), dtype=np.int64)
+    if aggregation == 'hard':
+        return indegree >= hard_agg_threshold
+    elif aggregation == 'soft':
+        skeleton = G.copy()
+        skeleton.simplify(multiple=True, loops=False, combine_edges=None)
+        distinct_out = np.asarray(skeleton.outdegree(), dtype=np.int64)
+        return ~((indegree == 0) & (distinct_out < 2))
+    raise ValueError(f"unknown aggregation {aggregation!r}, expected 'soft' or 'hard'")
+
+
+def giant_component_mask(G):
+    """Vertices of the largest weakly connected component of G as a boolean mask."""
+    membership = np.asarray(G.connected_components(mode="weak").membership)
+    if len(membership) == 0:
+        return np.ones(0, dtype=bool)
+    return membership == np.argmax(np.bincount(membership))
 
 
 def reduce_network(G,
                    giant_component=False, 
                    aggregation=None,
                    hard_agg_threshold=0,
-                   remove_self_loops=True):
+                   remove_self_loops=True,
+                   iterate=False,
+                   return_mapping=False):
     """Reduce network by aggregating nodes / links.
 
     Parameters:
@@ -139,73 +677,290 @@ def reduce_network(G,
     aggregation (str): 'soft' to remove nodes that are never retweeted and retweet only one user,
     'hard' to remove nodes that are retweeted less than {hard_agg_threshold} times.
     hard_agg_threshold(int)
+    iterate (boolean): repeat the aggregation (and giant component) steps until no
+    more vertices are removed, since removing nodes lowers the degree of their neighbours
+    return_mapping (boolean): also return the original indices of the kept vertices
     
     Returns:
     G (igraph graph object): reduced network
+    kept (numpy array): original vertex index of every vertex of the reduced network,
+    only if return_mapping is True
     """        
-    t = hard_agg_threshold
-    
-    # giant_component == False and aggregation == None
-    if giant_component == False and aggregation == None:
-        pass
-
-    # giant_component == True and aggregation == None
-    elif giant_component == True and aggregation == None:
-        G = G.components(mode="weak").giant()
-
-    # giant_component == False and aggregation == 'hard'
-    elif giant_component == False and aggregation == 'hard':
-        todel = []
-        for v in G.vs:
-            if G.degree(v, mode="in") < t:
-                todel.append(v.index)
-        G.delete_vertices(todel)
-
-    # giant_component == True and aggregation == 'hard'
-    elif giant_component == True and aggregation == 'hard':
-        todel = []
-        for v in G.vs:
-            if G.degree(v, mode="in") < t:
-                todel.append(v.index)
-        G.delete_vertices(todel)
-        G = G.components(mode="weak").giant()
-
-    # giant_component == False and aggregation == 'soft'
-    elif giant_component == False and aggregation == 'soft':
-        #G = G.components(mode="weak").giant()
-        todel = []
-        for v in G.vs:
-            if G.degree(v, mode="in") == 0 and len(set(G.neighbors(v, mode="out"))) < 2:
-                todel.append(v.index)
-        G.delete_vertices(todel)
-
-    # giant_component == True and aggregation == 'soft'
-    elif giant_component == True and aggregation == 'soft':
-        G = G.components(mode="weak").giant()
-        todel = []  
-        for v in G.vs:
-            if G.degree(v, mode="in") == 0 and len(set(G.neighbors(v, mode="out"))) < 2:
-                todel.append(v.index)
-        G.delete_vertices(todel)
+    kept = np.arange(G.vcount())
+
+    # 'soft' aggregation runs on the giant component, 'hard' aggregation before it
+    steps = []
+    if aggregation is not None:
+        steps.append(lambda H: aggregation_mask(H, aggregation, hard_agg_threshold))
+    if giant_component:
+        position = 0 if aggregation == 'soft' else len(steps)
+        steps.insert(position, giant_component_mask)
+
+    changed = True
+    while steps and changed:
+        changed = False
+        for step in steps:
+            keep = step(G)
+            if not keep.all():
+                # copy_and_delete keeps the relative vertex order, so kept stays aligned
+                G = G.induced_subgraph(np.flatnonzero(keep).tolist(),
+                                       implementation="copy_and_delete")
+                kept = kept[keep]
+                changed = True
+        if not iterate:
+            break
 
     # if remove_self_loops == True:
     #     G = G.simplify(multiple=False,loops=True)
 
+    if return_mapping:
+        return G, kept
+    return G
+
+
+def read_interactionnetwork(savename):
+    """Read a saved interaction network for further updates.
+
+    Prefers the pickle written by update_export, which keeps the tweet id
+    lists. Otherwise the GML export is read and its attribute names are
+    mapped back to the ones used by twitter_df_to_interactionnetwork.
+
+    Parameters:
+    savename (str): path the network was saved to, without extension
+
+    Returns:
+    G (igraph graph object): interaction network
+    """
+    if os.path.exists(savename + '.pickle'):
+        return ig.Graph.Read_Pickle(savename + '.pickle')
+    G = ig.Graph.Read_GML(savename + '.gml')
+    if 'id' in G.vs.attributes():
+        del G.vs['id']
+    if 'screenname' in G.vs.attributes():
+        G.vs['screen_name'] = G.vs['screenname']
+        del G.vs['screenname']
+    # GML cannot hold the tweet id lists
+    for attr in ('originaltweets', 'interactions'):
+        if attr not in G.vs.attributes():
+            G.vs[attr] = "None"
+    return G
+
+
+def _name_key(name):
+    # user ids come as int, float (columns with NaN) or str (GML), e.g. 12 / 12.0 / "12"
+    if isinstance(name, (float, np.floating)) and float(name).is_integer():
+        name = int(name)
+    return str(name)
+
+
+def _same_type(values, existing):
+    # ids in the type the graph already uses: write_gml drops attributes of mixed types
+    sample = next((x for x in existing if x is not None), None)
+    if isinstance(sample, str):
+        return [_name_key(x) for x in values]
+    if isinstance(sample, (float, np.floating)):
+        return [float(x) for x in values]
+    if isinstance(sample, (int, np.integer)):
+        return [int(float(x)) if isinstance(x, (float, np.floating)) else int(x) for x in values]
+    return list(values)
+
+
+def _merge_tweetids(prev, add):
+    # tweet id lists of two batches, which may overlap, keeping every id once
+    prev = [] if prev in (None, "None") else list(prev)
+    seen = set(map(_name_key, prev))
+    add = [] if add in (None, "None") else [x for x in add if _name_key(x) not in seen]
+    return prev + add if prev or add else "None"
+
+
+def update_interactionnetwork(G,
+                              df,
+                              interaction_type,
+                              starttime=None,
+                              endtime=None,
+                              users=None
+                              ):
+    """Append a new batch of tweets to an existing interaction network in place.
+
+    Only edges whose tweet id is not in G yet are added (with their tweetid
+    and timestamp), unseen users become new vertices, and the metadata of
+    users tweeting in the batch is refreshed: screen name, followers and
+    friends take the latest values, tweet ids are appended to
+    originaltweets / interactions. The indegree / outdegree vertex
+    attributes are kept up to date by adding the degrees of the new edges.
+
+    Users that tweeted in an earlier batch but only now become vertices are
+    looked up in {users}, the user table returned by the previous update;
+    without it they get the screen name they are interacted with and no
+    followers, friends or earlier original tweets.
+
+    Parameters:
+    G (igraph graph object): network built by twitter_df_to_interactionnetwork
+    df (pandas dataframe): new tweets in twitwi format
+    interaction_type (str): retweet/quote/reply/mention
+    starttime (int): use retweets beginning on that date [timestamp]
+    endtime (int): use retweets until on that date (including that last day) [timestamp]
+    users (dict): user table of all previous batches, if known: 'info' (user_info)
+    and 'originaltweets' (tweet ids per user_id)
+
+    Returns:
+    G (igraph graph object): the updated network
+    users (dict): the user table including this batch
+    """
+    idf = filter_timerange(df, starttime, endtime)
+    interactions,tuples = get_edgelist(idf,interaction_type)
+
+    # tweet ids come back from GML as floats or strings, so compare them like user ids
+    known = set(map(_name_key, G.es['tweetid'])) if G.ecount() else set()
+    tuples = tuples[~tuples['tweetid'].map(_name_key).isin(known).to_numpy()]
+    interactions = interactions[~interactions['id'].map(_name_key).isin(known).to_numpy()]
+
+    if 'indegree' not in G.vs.attributes():
+        G.vs['indegree'] = G.indegree()
+        G.vs['outdegree'] = G.outdegree()
+
+    # vertices are matched by the text of their name for the same reason
+    index = {_name_key(name): i for i, name in enumerate(G.vs['name'])}
+    new_names = {}
+    for name in chain(tuples['source'], tuples.iloc[:, 1]):
+        key = _name_key(name)
+        if key not in index and key not in new_names:
+            new_names[key] = name
+    if new_names:
+        n = G.vcount()
+        G.add_vertices(len(new_names), attributes={'name': _same_type(new_names.values(), G.vs['name']),
+                                                   'indegree': [0] * len(new_names),
+                                                   'outdegree': [0] * len(new_names)})
+        index.update((key, n + i) for i, key in enumerate(new_names))
+
+    source = np.array([index[_name_key(x)] for x in tuples['source']], dtype=np.int64)
+    target = np.array([index[_name_key(x)] for x in tuples.iloc[:, 1]], dtype=np.int64)
+    G.add_edges(list(zip(source.tolist(), target.tolist())),
+                attributes={'tweetid': _same_type(tuples['tweetid'].tolist(),
+                                                  G.es['tweetid'] if G.ecount() else []),
+                            'timestamp': tuples['timestamp'].tolist()})
+
+    indegree = np.asarray(G.vs['indegree'], dtype=np.int64)
+    outdegree = np.asarray(G.vs['outdegree'], dtype=np.int64)
+    np.add.at(indegree, target, 1)
+    np.add.at(outdegree, source, 1)
+    G.vs['indegree'] = indegree.tolist()
+    G.vs['outdegree'] = outdegree.tolist()
+
+    ## update the user table
+    users = users or {'info': None, 'originaltweets': pd.Series(dtype=object)}
+    batch_info = user_info(df)
+    id2info = _combine_last(users['info'], batch_info)
+    originaltweets = idf[(idf['retweeted_id'].isna())&(idf['quoted_id'].isna())]
+    batch_originals = tweetids_per_user(originaltweets)
+    originaltweetids = pd.concat([users['originaltweets'], batch_originals])
+    if originaltweetids.index.has_duplicates:
+        originaltweetids = originaltweetids.groupby(level=0).agg(
+            lambda lists: reduce(_merge_tweetids, lists, "None"))
+    users = {'info': id2info, 'originaltweets': originaltweetids}
+
+    ## refresh the metadata of new vertices and of users tweeting in this batch
+    first_new = G.vcount() - len(new_names)
+    touched = sorted({index[_name_key(x)] for x in batch_info.index if _name_key(x) in index} |
+                     set(range(first_new, G.vcount())))
+    if not touched:
+        return G, users
+    H = ig.Graph(n=len(touched))
+    H.vs['name'] = G.vs[touched]['name']
+    fill_node_metadata(H, id2info, target_info(df, interactions, interaction_type),
+                       originaltweetids, tweetids_per_user(interactions))
+
+    vs = G.vs[touched]
+    # without the table of earlier batches id2info only knows this batch's users,
+    # the others keep what their vertex already carries
+    informed = set(map(_name_key, id2info.index))
+    known = [_name_key(name) in informed for name in vs['name']]
+    for attr in ('screen_name', 'followers', 'friends'):
+        vs[attr] = [add if k or prev is None else prev
+                    for prev, add, k in zip(vs[attr], H.vs[attr], known)]
+    for attr in ('originaltweets', 'interactions'):
+        vs[attr] = [_merge_tweetids(prev, add)
+                    for prev, add in zip(vs[attr], H.vs[attr])]
+    return G, users
+
+
+def update_export(savename, df, interaction_type, starttime=None, endtime=None):
+    """Apply a new batch of tweets to a saved network and rewrite its exports.
+
+    Parameters:
+    savename (str): path the network was saved to, e.g. export/worldcup/retweet
+    df (pandas dataframe): new tweets in twitwi format
+    interaction_type (str): retweet/quote/reply/mention
+    starttime (int): use retweets beginning on that date [timestamp]
+    endtime (int): use retweets until on that date (including that last day) [timestamp]
+
+    Returns:
+    G (igraph graph object): the updated network, saved with convert_graph
+    and as savename.pickle for the next update (the user table as savename.users.pickle)
+    """
+    G = read_interactionnetwork(savename)
+    path = savename + '.users.pickle'
+    users = pd.read_pickle(path) if os.path.exists(path) else None
+    G, users = update_interactionnetwork(G, df, interaction_type, starttime, endtime, users)
+    convert_graph(G, savename)
+    write_update_state(G, users, savename)
     return G
 
 
-def convert_graph(G, savename):
-    """Convert igraph graph to gml, csv and gv.
+def user_table(df, starttime=None, endtime=None):
+    """User table of a collection, as update_interactionnetwork returns it.
+
+    Returns:
+    users (dict): 'info' (user_info) and 'originaltweets' (tweet ids per user_id)
+    """
+    idf = filter_timerange(df, starttime, endtime)
+    originaltweets = idf[(idf['retweeted_id'].isna())&(idf['quoted_id'].isna())]
+    return {'info': user_info(df), 'originaltweets': tweetids_per_user(originaltweets)}
+
+
+def write_update_state(G, users, savename):
+    """Save what update_export needs next: the graph with its tweet id lists and the user table.
+
+    GML drops the list attributes, so the graph goes to savename.pickle and
+    the user table to savename.users.pickle.
+    """
+    G.write_pickle(savename + '.pickle.tmp')
+    os.replace(savename + '.pickle.tmp', savename + '.pickle')
+    path = savename + '.users.pickle'
+    pd.to_pickle(users, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def convert_graph(G, savename, layouts=('drl',), centrality=tuple(CENTRALITY_MEASURES),
+                  communities='leiden'):
+    """Convert igraph graph to gml, csv, gv and a binary snapshot.
 
     Parameters:
     G (igraph graph): cluster graph
     savename (str): path to save the networks
+    layouts (list): server-side layouts to precompute for the dashboard, see layouts.py
+    centrality (list): centrality measures stored as vertex attributes, see centrality.py
+    communities (str): 'leiden' or 'louvain' community detection stored as the 'community'
+        vertex attribute, None to skip it
 
     Returns:
-    saves the networks to savename
+    saves the networks to savename (the snapshot to savename.snap, see snapshot.py,
+    layouts to savename.layout-{name}.npy, the community graph to savename.communities.gml,
+    the dashboard elements to savename.elements-{budget}.json)
     """        
     warnings.filterwarnings("ignore", category=RuntimeWarning)
-    G.write_gml(savename + '.gml')
-    G.write_edgelist(savename + '.csv')
-    G.write_dot(savename + '.gv')
+    add_centrality(G, centrality)
+    if communities is not None:
+        G.vs['community'] = community_membership(G, communities).tolist()
+    # write next to the target and swap in, so readers never see partial files
+    for ext, write in (('.gml', G.write_gml), ('.csv', G.write_edgelist), ('.gv', G.write_dot)):
+        write(savename + ext + '.tmp')
+        os.replace(savename + ext + '.tmp', savename + ext)
+    write_snapshot(G, savename + '.snap')
+    Q = None
+    if communities is not None:
+        Q = write_quotient_graph(G, savename, G.vs['community'])
+    for name in layouts:
+        write_layout(G, savename, name)
+    write_elements(G, savename, Q=Q)
     warnings.filterwarnings("default", category=RuntimeWarning)
@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+
+import igraph as ig
+import numpy as np
+
+
+SNAPSHOT_VERSION = 1
+
+
+def _column_name(attr):
+    # follow the GML export, which drops non-alphanumeric characters
+    # (screen_name is read back as screenname)
+    return "".join(c for c in attr if c.isalnum())
+
+
+def _column(values):
+    """Convert a list of attribute values to a fixed-width numpy column.
+
+    Returns None for attributes that cannot be stored as a flat column
+    (lists of tweet ids, mixed objects).
+    """
+    if any(isinstance(v, (list, tuple, dict, set)) for v in values):
+        return None
+    if all(isinstance(v, (bool, np.bool_)) for v in values):
+        return np.asarray(values, dtype=bool)
+    if all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in values):
+        return np.asarray(values, dtype=np.int64)
+    if all(isinstance(v, (int, float, np.integer, np.floating)) for v in values):
+        # user ids mix int sources with float targets (CSV columns with gaps);
+        # float64 cannot hold ids above 2**53, so whole numbers stay int64
+        if (any(isinstance(v, (int, np.integer)) for v in values)
+                and all(float(v).is_integer() for v in values)):
+            return np.asarray([int(v) for v in values], dtype=np.int64)
+        return np.asarray(values, dtype=np.float64)
+    return np.asarray([str(v) for v in values], dtype=str)
+
+
+def write_snapshot(G, path):
+    """Write an igraph graph as a columnar binary snapshot.
+
+    The snapshot is a folder of .npy files that can be memory-mapped:
+    src/dst edge arrays, a CSR out-adjacency (indptr/indices) and one
+    file per vertex (v_*) and edge (e_*) attribute, plus a meta.json.
+    The folder is written next to the target and swapped in at the end,
+    so readers never see a half-written snapshot.
+
+    Parameters:
+    G (igraph graph object): graph to save
+    path (str): target folder, e.g. export/worldcup/retweet.snap
+
+    Returns:
+    saves the snapshot to path
+    """
+    n = G.vcount()
+    edges = np.asarray(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    src, dst = edges[:, 0], edges[:, 1]
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+
+    arrays = {
+        'src': src,
+        'dst': dst,
+        'indptr': indptr,
+        'indices': dst[order],
+    }
+    meta = {
+        'version': SNAPSHOT_VERSION,
+        'directed': G.is_directed(),
+        'vcount': n,
+        'ecount': G.ecount(),
+        'vertex_columns': [],
+        'edge_columns': [],
+    }
+    for prefix, seq, key in (('v_', G.vs, 'vertex_columns'), ('e_', G.es, 'edge_columns')):
+        for attr in seq.attributes():
+            col = _column(seq[attr])
+            if col is None:
+                continue
+            name = _column_name(attr)
+            arrays[prefix + name] = col
+            meta[key].append(name)
+
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, name + '.npy'), arr)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    if os.path.exists(path):
+        old = path + '.old'
+        os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, path)
+
+
+class Snapshot:
+    """Arrays of a binary graph snapshot, memory-mapped by default.
+
+    Attributes:
+    meta (dict): content of meta.json
+    src, dst (numpy array): edge endpoints in original edge order
+    indptr, indices (numpy array): CSR out-adjacency
+    vertex (dict): vertex attribute columns
+    edge (dict): edge attribute columns
+    """
+
+    def __init__(self, path, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode=mode)
+
+        self.path = path
+        self.src = load('src')
+        self.dst = load('dst')
+        self.indptr = load('indptr')
+        self.indices = load('indices')
+        self.vertex = {c: load('v_' + c) for c in self.meta['vertex_columns']}
+        self.edge = {c: load('e_' + c) for c in self.meta['edge_columns']}
+
+    @property
+    def vcount(self):
+        return self.meta['vcount']
+
+    @property
+    def ecount(self):
+        return self.meta['ecount']
+
+    def indegree(self):
+        # collapsed graphs count every interaction of a weighted edge
+        if 'weight' in self.edge:
+            return np.bincount(self.dst, weights=self.edge['weight'], minlength=self.vcount).astype(np.int64)
+        return np.bincount(self.dst, minlength=self.vcount)
+
+    def outdegree(self):
+        if 'weight' in self.edge:
+            return np.bincount(self.src, weights=self.edge['weight'], minlength=self.vcount).astype(np.int64)
+        return np.diff(self.indptr)
+
+    def to_graph(self, vertex_columns=None, edge_columns=None):
+        """Rebuild the igraph graph object from the snapshot arrays.
+
+        Parameters:
+        vertex_columns (list): vertex attributes to copy into the graph, all by default
+        edge_columns (list): edge attributes to copy into the graph, all by default
+        """
+        G = ig.Graph(n=self.vcount,
+                     edges=np.column_stack([self.src, self.dst]).tolist(),
+                     directed=self.meta['directed'])
+        for c, arr in self.vertex.items():
+            if vertex_columns is None or c in vertex_columns:
+                G.vs[c] = arr.tolist()
+        for c, arr in self.edge.items():
+            if edge_columns is None or c in edge_columns:
+                G.es[c] = arr.tolist()
+        return G
+
+
+def read_snapshot(path, mmap=True):
+    """Open a binary graph snapshot written by write_snapshot.
+
+    Parameters:
+    path (str): snapshot folder
+    mmap (boolean): memory-map the arrays instead of reading them into memory
+
+    Returns:
+    snapshot (Snapshot): the snapshot arrays
+    """
+    return Snapshot(path, mmap=mmap)
+
+
+def read_graph(path):
+    """Read a binary graph snapshot straight into an igraph graph object."""
+    return Snapshot(path).to_graph()
@@ -0,0 +1,180 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+BIN_WIDTH = 3600
+
+
+def edge_timestamps(G):
+    """Timestamp per edge: 'timestamp', or the first interaction of collapsed graphs."""
+    attrs = G.es.attributes()
+    name = 'timestamp' if 'timestamp' in attrs else 'first'
+    if name not in attrs:
+        raise ValueError("graph has no timestamp or first edge attribute")
+    return np.asarray(G.es[name], dtype=np.float64).astype(np.int64)
+
+
+def timestamps_path(savename):
+    return f"{savename}.timestamps.npy"
+
+
+def write_interaction_timestamps(timestamps, savename):
+    """Save the timestamp of every interaction of a collapsed network to savename.timestamps.npy.
+
+    Parameters:
+    timestamps (numpy array): timestamps in the order of savename.tweetids.npy,
+        i.e. grouped by edge (see networks.collapse_edgelist)
+    savename (str): path of the export without extension
+    """
+    tmp = timestamps_path(savename) + '.tmp.npy'
+    np.save(tmp, np.asarray(timestamps, dtype=np.int64))
+    os.replace(tmp, timestamps_path(savename))
+
+
+def read_interaction_timestamps(G, savename):
+    """Interaction timestamps saved with a collapsed network, None if missing or not matching G."""
+    path = timestamps_path(savename)
+    if 'weight' not in G.es.attributes() or not os.path.exists(path):
+        return None
+    timestamps = np.load(path)
+    if len(timestamps) != int(np.sum(G.es['weight'])):
+        return None
+    return timestamps
+
+
+class TemporalIndex:
+    """Interactions of a graph sorted by timestamp, for time window queries.
+
+    A window [start, end] is found with two binary searches and is a
+    contiguous slice of the sorted arrays, so degrees and subgraphs of
+    any window are computed from that slice without going back to the
+    tweets. Summaries of fixed-width bins (see bins) are computed once per
+    index.
+
+    Graphs with one edge per tweet are indexed by edge. The weighted edges
+    of collapsed graphs hold many interactions: with their timestamps
+    (see read_interaction_timestamps) every interaction is indexed on its
+    own, without them an edge is placed at its first interaction and
+    windows are only approximate (exact is False).
+
+    Parameters:
+    G (igraph graph object): interaction graph with timestamp (or first) edge attributes
+    bin_width (int): width of the precomputed bins in seconds
+    timestamps (numpy array): timestamp of every interaction, grouped by edge, for collapsed graphs
+
+    Attributes:
+    timestamps (numpy array): sorted interaction timestamps
+    edges (numpy array): edge index per sorted position
+    src, dst (numpy array): endpoints per sorted position
+    weights (numpy array): interactions per sorted position (1 unless collapsed without timestamps)
+    exact (boolean): whether every interaction has its own timestamp
+    """
+
+    def __init__(self, G, bin_width=BIN_WIDTH, timestamps=None):
+        self.vcount = G.vcount()
+        self.bin_width = bin_width
+        weighted = 'weight' in G.es.attributes()
+        if timestamps is None:
+            timestamps = edge_timestamps(G)
+            edges = np.arange(G.ecount())
+            if weighted:
+                weights = np.asarray(G.es['weight'], dtype=np.int64)
+            else:
+                weights = np.ones(G.ecount(), dtype=np.int64)
+            self.exact = not weighted
+        else:
+            counts = np.asarray(G.es['weight'], dtype=np.int64) if weighted else np.ones(G.ecount(), dtype=np.int64)
+            edges = np.repeat(np.arange(G.ecount()), counts)
+            timestamps = np.asarray(timestamps, dtype=np.int64)
+            weights = np.ones(len(edges), dtype=np.int64)
+            self.exact = True
+        order = np.argsort(timestamps, kind='stable')
+        self.edges = edges[order]
+        self.timestamps = timestamps[order]
+        self.weights = weights[order]
+        endpoints = np.asarray(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)[self.edges]
+        self.src, self.dst = endpoints[:, 0], endpoints[:, 1]
+        self._bins = None
+
+    @property
+    def start(self):
+        return int(self.timestamps[0]) if len(self.timestamps) else 0
+
+    @property
+    def end(self):
+        return int(self.timestamps[-1]) if len(self.timestamps) else 0
+
+    def window(self, start=None, end=None):
+        """Slice of the sorted edge arrays between start and end (both included)."""
+        lo = 0 if start is None else np.searchsorted(self.timestamps, start, side='left')
+        hi = len(self.timestamps) if end is None else np.searchsorted(self.timestamps, end, side='right')
+        return slice(lo, hi)
+
+    def edge_ids(self, start=None, end=None):
+        """Sorted indices of the graph edges with at least one interaction inside the window."""
+        return np.unique(self.edges[self.window(start, end)])
+
+    def vertex_ids(self, start=None, end=None):
+        """Sorted indices of the vertices with at least one interaction inside the window."""
+        w = self.window(start, end)
+        return np.unique(np.concatenate([self.src[w], self.dst[w]]))
+
+    def degrees(self, start=None, end=None, mode='in'):
+        """In-, out- or total number of interactions per vertex inside the window."""
+        w = self.window(start, end)
+        degree = np.zeros(self.vcount, dtype=np.int64)
+        if mode in ('in', 'all'):
+            degree += np.bincount(self.dst[w], weights=self.weights[w], minlength=self.vcount).astype(np.int64)
+        if mode in ('out', 'all'):
+            degree += np.bincount(self.src[w], weights=self.weights[w], minlength=self.vcount).astype(np.int64)
+        return degree
+
+    def subgraph(self, G, start=None, end=None):
+        """Subgraph of G with the edges inside the window and their endpoints.
+
+        Weighted edges get the number of their interactions inside the window.
+
+        Returns:
+        H (igraph graph object): the window subgraph
+        ids (numpy array): index in G of every vertex of H
+        """
+        w = self.window(start, end)
+        edges, inverse = np.unique(self.edges[w], return_inverse=True)
+        H = G.subgraph_edges(edges.tolist(), delete_vertices=True)
+        if 'weight' in H.es.attributes():
+            H.es['weight'] = np.bincount(inverse.reshape(-1), weights=self.weights[w],
+                                         minlength=len(edges)).astype(np.int64).tolist()
+        return H, self.vertex_ids(start, end)
+
+    def bins(self, k=10):
+        """Users, interactions and most interacted-with users per time bin.
+
+        Computed on first use and kept with the index.
+
+        Parameters:
+        k (int): number of top users (by in-degree) per bin
+
+        Returns:
+        bins (pandas df): start/end/users/interactions/top columns, one row per bin,
+        top being the vertex indices of the bin's k highest in-degrees
+        """
+        if self._bins is None:
+            first = self.start - self.start % self.bin_width
+            bounds = np.arange(first, self.end + self.bin_width + 1, self.bin_width)
+            positions = np.searchsorted(self.timestamps, bounds, side='left')
+            rows = []
+            for start, lo, hi in zip(bounds[:-1], positions[:-1], positions[1:]):
+                src, dst, weights = self.src[lo:hi], self.dst[lo:hi], self.weights[lo:hi]
+                users, position = np.unique(dst, return_inverse=True)
+                indegree = np.bincount(position.reshape(-1), weights=weights, minlength=len(users))
+                rows.append({
+                    'start': int(start),
+                    'end': int(start + self.bin_width - 1),
+                    'users': len(np.union1d(src, dst)),
+                    'interactions': int(weights.sum()),
+                    'top': users[np.argsort(-indegree, kind='stable')[:k]].tolist(),
+                })
+            self._bins = pd.DataFrame(rows, columns=['start', 'end', 'users', 'interactions', 'top'])
+        return self._bins
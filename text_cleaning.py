@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+
+URL_PATTERN = r"http\S+"
+MENTION_PATTERN = r"(?<!\S)@\S*"
+NON_ALPHA_PATTERN = r"[^a-z]+"
+
+
+def _clean(texts):
+    texts = texts.fillna("").astype(str)
+    texts = texts.str.replace(URL_PATTERN, "", regex=True).str.lower()
+    texts = texts.str.replace(MENTION_PATTERN, "", regex=True)
+    return texts.str.replace(NON_ALPHA_PATTERN, " ", regex=True).str.strip()
+
+
+def clean_texts(texts, processes=None, chunksize=100000):
+    """Clean tweet texts for topic modelling.
+
+    Removes links, lowercases, drops @-mentions and replaces everything but
+    letters by single spaces, like the row-wise cleaning of the BERTopic
+    notebook, but with vectorized pandas string operations. Missing texts
+    become empty strings.
+
+    Parameters:
+    texts (pandas series / list): tweet texts
+    processes (int): clean chunks of {chunksize} texts in that many processes
+    chunksize (int): texts per chunk when cleaning in parallel
+
+    Returns:
+    texts (pandas series): cleaned texts, with the index of the input
+    """
+    texts = pd.Series(texts)
+    if not processes or processes < 2 or len(texts) <= chunksize:
+        return _clean(texts)
+    chunks = [texts.iloc[i:i + chunksize] for i in range(0, len(texts), chunksize)]
+    with ProcessPoolExecutor(processes) as pool:
+        return pd.concat(pool.map(_clean, chunks))
+